@@ -0,0 +1,97 @@
+import argparse
+from dt import *
+
+"""
+BENCHMARK: draws per second, selection latency and peak memory of DT.run for
+each policy, sweeping one of the number of sources n, the number of groups m
+and the total query at a time around a central configuration, on synthetic
+and real (array-backed) sources, the latter with dense and with sparse
+counts. --full runs the whole n x m x query product instead.
+
+    python benchmark.py --out results/benchmark.json
+    python benchmark.py --out new.json --baseline results/benchmark.json
+"""
+
+source_counts = [2, 10, 100, 1000]
+group_counts = [2, 10, 100, 500]
+total_queries = [10 ** 2, 10 ** 4, 10 ** 6]
+center = (10, 10, 10 ** 4)
+quick_source_counts = [2, 10, 100]
+quick_group_counts = [2, 10, 100]
+quick_total_queries = [10 ** 2, 10 ** 4]
+# Real sources are finite, so only policies that account for duplicates
+# are guaranteed to terminate on them
+policies = {
+    'synthetic': ['random', 'coupcoll-nodupe', 'ratiocoll-nodupe',
+                  'epsilon-exact-nodupe', 'epsilon-bayes-nodupe', 'dualcoll',
+                  'ucb'],
+    'real': ['random', 'coupcoll-dupe', 'ratiocoll-dupe',
+             'epsilon-exact-dupe', 'epsilon-bayes-dupe'],
+    'sparse': ['random', 'coupcoll-dupe', 'ratiocoll-dupe',
+               'epsilon-exact-dupe', 'epsilon-bayes-dupe'],
+}
+
+def sweep(sources, groups, queries, full):
+    """
+    @returns the (n, m, total_query) configurations to run
+    """
+    if full:
+        return [ (n, m, q) for n in sources for m in groups for q in queries ]
+    n0, m0, q0 = center
+    configs = [ (n, m0, q0) for n in sources ]
+    configs += [ (n0, m, q0) for m in groups ]
+    configs += [ (n0, m0, q) for q in queries ]
+    # Drop the repeats of the central configuration
+    return list(dict.fromkeys(configs))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark DT.run")
+    parser.add_argument("--out", default="results/benchmark.json",
+                        help="where to save the results as JSON")
+    parser.add_argument("--baseline",
+                        help="a previous result file to compare against")
+    parser.add_argument("--full", action="store_true",
+                        help="run the full n x m x query product")
+    parser.add_argument("--quick", action="store_true",
+                        help="run a smaller sweep")
+    parser.add_argument("--fixtures", default=",".join(FIXTURES),
+                        help="comma-separated fixtures to run")
+    parser.add_argument("--policies",
+                        help="comma-separated policies, replacing the "
+                             "default ones of every fixture")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="timed runs of each cell, the fastest is kept")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="time limit of each cell in seconds, over all "
+                             "repeats")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change reported as a regression or "
+                             "an improvement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.quick:
+        configs = sweep(quick_source_counts, quick_group_counts,
+                        quick_total_queries, args.full)
+    else:
+        configs = sweep(source_counts, group_counts, total_queries, args.full)
+    cells = []
+    for fixture in args.fixtures.split(","):
+        if args.policies:
+            fixture_policies = args.policies.split(",")
+        else:
+            fixture_policies = policies[fixture]
+        cells += [ (fixture, policy, n, m, q) for n, m, q in configs
+                   for policy in fixture_policies ]
+    benchmarks = run_benchmarks(cells, repeats=args.repeats,
+                                timeout=args.timeout,
+                                base_seed=args.seed)
+    save_benchmarks(benchmarks, args.out)
+    if args.baseline:
+        baseline = load_benchmarks(args.baseline)
+        for key, throughput, latency, verdict in compare_benchmarks(
+                baseline, benchmarks, args.threshold):
+            print("%s %s n=%d m=%d q=%d: " % key
+                  + "draws/s x%s, select latency x%s %s" % (
+                      "%.2f" % throughput if throughput else "?",
+                      "%.2f" % latency if latency else "?", verdict))
@@ -6,7 +6,21 @@ RatioColl and EpsilonGreedy, as well as baselines CoupColl and random.
 from .utils import *
 from .data_point import *
 from .stat_tracker import *
+from .permutation import *
 from .real_source import *
+from .array_source import *
+from .group_schema import *
 from .synthetic_source import *
+from .source_frontier import *
+from .group_scorer import *
+from .async_source import *
+from .score_cache import *
+from .trace import *
+from .checkpoint import *
+from .policy import *
 from .dt import *
 from .estimator import *
+from .results_store import *
+from .experiment import *
+from .comparison import *
+from .benchmark import *
@@ -0,0 +1,286 @@
+import os
+import random
+import numpy as np
+from .stat_tracker import *
+from .data_point import *
+from .real_source import *
+
+"""
+Represents a real-world data source stored column-wise: group labels in a
+compact unsigned integer array and record ids in a parallel int64 array.
+DataPoint instances are only materialized when a record is sampled.
+
+Sources can be saved to and memory-mapped from a flat binary file laid out as:
+    magic (8 bytes)
+    num_groups, num_records, group itemsize (int64 each), cost (float64)
+    ground truth count of each group (int64 * num_groups)
+    record ids (int64 * num_records)
+    group labels (unsigned, group itemsize * num_records)
+all in little-endian byte order.
+"""
+
+SOURCE_FILE_MAGIC = b"DTSRC\x00\x00\x01"
+SOURCE_FILE_HEADER = np.dtype([("num_groups", "<i8"), ("num_records", "<i8"),
+                               ("group_itemsize", "<i8"), ("cost", "<f8")])
+
+class ArraySource(RealSource):
+    def __init__(self, num_groups, cost, groups=None, ids=None, sparse=False,
+                 replace=True):
+        """
+        @params
+            num_groups: the number of groups that data points may belong to
+            cost: cost of sampling from this data source
+            groups: an optional array-like of group labels
+            ids: an optional array-like of record ids parallel to groups,
+                 defaults to the positions of the records
+            sparse: if True, counts are kept in SparseStatTracker instances
+            replace: if False, records are sampled without replacement
+        """
+        super().__init__(num_groups, cost, sparse, replace)
+        del self.data_points
+        self.group_dtype = np.min_scalar_type(max(num_groups - 1, 0))
+        self.groups = np.empty(0, dtype=self.group_dtype)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.size = 0
+        # Sampled records, so that repeated draws of a record return the same
+        # DataPoint object as RealSource does
+        self.materialized = {}
+        if groups is not None:
+            self.add_arrays(groups, ids)
+
+    @classmethod
+    def from_real_source(cls, source):
+        """
+        @returns an ArraySource holding the same records as a RealSource,
+                 whose DataPoint data must be integer ids
+        """
+        groups = [ point.group for point in source.data_points ]
+        ids = [ point.data for point in source.data_points ]
+        return cls(source.num_groups, source.cost, groups, ids, source.sparse,
+                   source.replace)
+
+    @classmethod
+    def open(cls, path, sparse=False, replace=True):
+        """
+        Opens a source file written by save() without reading the records,
+        which are memory-mapped read-only and so shared between processes.
+        @params
+            sparse: if True, counts are kept in SparseStatTracker instances
+            replace: if False, records are sampled without replacement
+        @returns an ArraySource backed by the file
+        """
+        with open(path, "rb") as f:
+            if f.read(len(SOURCE_FILE_MAGIC)) != SOURCE_FILE_MAGIC:
+                raise ValueError(str(path) + " is not a data source file")
+            header = np.fromfile(f, dtype=SOURCE_FILE_HEADER, count=1)[0]
+            num_groups = int(header["num_groups"])
+            gt_counts = np.fromfile(f, dtype="<i8", count=num_groups)
+        size = int(header["num_records"])
+        group_dtype = np.dtype("<u" + str(int(header["group_itemsize"])))
+        offset = len(SOURCE_FILE_MAGIC) + SOURCE_FILE_HEADER.itemsize
+        offset += 8 * num_groups
+        source = cls(num_groups, float(header["cost"]), sparse=sparse,
+                     replace=replace)
+        source.group_dtype = group_dtype
+        source.size = size
+        if size > 0:
+            source.ids = np.memmap(path, dtype="<i8", mode="r", offset=offset,
+                                   shape=(size,))
+            source.groups = np.memmap(path, dtype=group_dtype, mode="r",
+                                      offset=offset + 8 * size, shape=(size,))
+        source.gt_stats = source.new_stats(gt_counts.tolist())
+        return source
+
+    def save(self, path):
+        """
+        Writes this source to a file that open() can memory-map.
+        """
+        header = np.zeros(1, dtype=SOURCE_FILE_HEADER)
+        header["num_groups"] = self.num_groups
+        header["num_records"] = self.size
+        header["group_itemsize"] = np.dtype(self.group_dtype).itemsize
+        header["cost"] = self.cost
+        gt_counts = [ self.gt_stats[g] for g in range(self.num_groups) ]
+        group_dtype = np.dtype(self.group_dtype).newbyteorder("<")
+        with open(path, "wb") as f:
+            f.write(SOURCE_FILE_MAGIC)
+            header.tofile(f)
+            np.asarray(gt_counts, dtype="<i8").tofile(f)
+            self.ids[:self.size].astype("<i8").tofile(f)
+            self.groups[:self.size].astype(group_dtype).tofile(f)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        return self.point(position)
+
+    def __getstate__(self):
+        # Trim unused capacity and drop materialized points before pickling
+        state = self.__dict__.copy()
+        state['groups'] = self.groups[:self.size].copy()
+        state['ids'] = self.ids[:self.size].copy()
+        state['materialized'] = {}
+        return state
+
+    def reserve(self, capacity):
+        """
+        Grows the backing arrays to hold at least capacity records.
+        """
+        if capacity <= len(self.groups):
+            return
+        capacity = max(capacity, 2 * len(self.groups))
+        groups = np.empty(capacity, dtype=self.group_dtype)
+        groups[:self.size] = self.groups[:self.size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        self.groups = groups
+        self.ids = ids
+
+    def add_point(self, data_point):
+        """
+        @params
+            data_point: a DataPoint with a valid group and an integer data id
+        """
+        self.reserve(self.size + 1)
+        self.groups[self.size] = data_point.group
+        self.ids[self.size] = data_point.data
+        self.size += 1
+        self.gt_stats.add_point(data_point.group)
+
+    def add_arrays(self, groups, ids=None):
+        """
+        Appends many records at once.
+        @params
+            groups: an array-like of group labels
+            ids: an optional array-like of record ids parallel to groups,
+                 defaults to the positions of the records
+        """
+        groups = np.asarray(groups)
+        count = len(groups)
+        if count == 0:
+            return
+        if groups.dtype.kind not in "iub":
+            raise ValueError("group labels must be integers, not "
+                             + str(groups.dtype))
+        groups = groups.astype(self.group_dtype, copy=False)
+        if ids is None:
+            ids = np.arange(self.size, self.size + count, dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+        self.reserve(self.size + count)
+        self.groups[self.size:self.size + count] = groups
+        self.ids[self.size:self.size + count] = ids
+        self.size += count
+        if self.sparse:
+            labels, counts = np.unique(groups, return_counts=True)
+            gt_counts = self.gt_stats.snapshot()
+            for g, count in zip(labels.tolist(), counts.tolist()):
+                gt_counts[g] = gt_counts.get(g, 0) + count
+        else:
+            counts = np.bincount(groups, minlength=self.num_groups)
+            gt_counts = [ self.gt_stats[g] + int(counts[g])
+                          for g in range(self.num_groups) ]
+        self.gt_stats = self.new_stats(gt_counts)
+
+    def point(self, position):
+        """
+        @returns the DataPoint at the specified position, materializing it on
+                 first access
+        """
+        data_point = self.materialized.get(position)
+        if data_point is None:
+            data_point = DataPoint(int(self.groups[position]),
+                                   int(self.ids[position]))
+            self.materialized[position] = data_point
+        return data_point
+
+    def sample(self):
+        """
+        @returns a uniformly random data point and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            data_point = self.point(self.draw_position(rand))
+        else:
+            data_point = self.point(rand.randrange(self.size))
+        self.sample_stats.add_point(data_point.group)
+        return data_point
+
+    def sample_batch(self, k):
+        """
+        @returns a list of k uniformly random data points, drawn with
+                 replacement unless the source was created with
+                 replace=False, and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            positions = [ self.draw_position(rand) for _ in range(k) ]
+        else:
+            positions = rand.choices(range(self.size), k=k)
+        data_points = [ self.point(position) for position in positions ]
+        self.sample_stats.add_points([ point.group for point in data_points ])
+        return data_points
+
+    def sample_position(self):
+        """
+        Samples like sample() without materializing a DataPoint.
+        @returns a tuple (position, group) and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            position = self.draw_position(rand)
+        else:
+            position = rand.randrange(self.size)
+        group = int(self.groups[position])
+        self.sample_stats.add_point(group)
+        return position, group
+
+    def sample_position_batch(self, k):
+        """
+        @returns a list of k (position, group) tuples, drawn with
+                 replacement unless the source was created with
+                 replace=False, and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            positions = [ self.draw_position(rand) for _ in range(k) ]
+        else:
+            positions = rand.choices(range(self.size), k=k)
+        groups = self.groups[positions].tolist()
+        self.sample_stats.add_points(groups)
+        return list(zip(positions, groups))
+
+    def reset_sample(self):
+        super().reset_sample()
+        self.materialized = {}
+
+def save_sources(sources, directory):
+    """
+    Saves each ArraySource to its own numbered file in the directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for i, source in enumerate(sources):
+        source.save(os.path.join(directory, "source-%04d.dts" % i))
+
+def open_sources(directory, sparse=False, replace=True):
+    """
+    @returns the list of memory-mapped sources saved by save_sources()
+    """
+    names = sorted(name for name in os.listdir(directory)
+                   if name.endswith(".dts"))
+    return [ ArraySource.open(os.path.join(directory, name), sparse, replace)
+             for name in names ]
+
+# Test cases
+if __name__ == '__main__':
+    source = ArraySource(2, 1.0, [0, 0, 0, 0, 1], [10, 11, 12, 13, 14])
+    source.add_point(DataPoint(1, 15))
+    print(source)
+    for i in range(101):
+        if i % 10 == 0:
+            print('i = ' + str(i))
+            print("sampled point", source.sample())
+            print("gt prob", source.probability(0))
+            print("sample prob", source.probability(0, method="sample-nodupe"))
+            print()
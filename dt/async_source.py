@@ -0,0 +1,64 @@
+import asyncio
+import random
+
+"""
+Data sources whose draws take real time, such as a database or an API, for
+DT.run_async. An async source pairs a local source, which carries the cost and
+the sample statistics the policies estimate probabilities from, with a
+coroutine fetching one point, and caps how many of its draws may be in flight
+at once.
+"""
+
+class AsyncSource:
+    # Maximum number of outstanding draws from this source
+    max_concurrency = 1
+
+    def __init__(self, source):
+        """
+        @params
+            source: the local RealSource or SyntheticSource standing for the
+                    remote one, it is the object the policies select
+        """
+        self.source = source
+
+    async def sample(self):
+        """
+        Fetches one point. Like RealSource.sample(), it must add the point's
+        group to source.sample_stats.
+        @returns a DataPoint
+        """
+        raise NotImplementedError
+
+class LatencySource(AsyncSource):
+    """
+    An in-process stand-in for a remote source, which answers each draw from
+    its local source after a simulated request latency.
+    """
+    def __init__(self, source, latency=0.01, jitter=0.0, max_concurrency=4,
+                 rng=None):
+        """
+        @params
+            source: the local RealSource or SyntheticSource to draw from
+            latency: the minimum latency of a draw, in seconds
+            jitter: an extra latency drawn uniformly from [0, jitter)
+            max_concurrency: maximum number of outstanding draws
+            rng: a random.Random used for the jitter, if not given the
+                 random module is used
+        """
+        super().__init__(source)
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.latency = latency
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.rng = rng
+
+    async def sample(self):
+        delay = self.latency
+        if self.jitter > 0.0:
+            rand = self.rng or random
+            delay += self.jitter * rand.random()
+        await asyncio.sleep(delay)
+        # The point is drawn on arrival, so the sample stats only ever reflect
+        # draws that have completed
+        return self.source.sample()
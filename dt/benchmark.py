@@ -0,0 +1,268 @@
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+from .stat_tracker import *
+from .array_source import *
+from .synthetic_source import *
+from .dt import *
+from .experiment import *
+
+"""
+Measures how DT.run scales. Each benchmark cell runs one policy to completion
+on a generated instance of n sources, m groups and a total query, and reports
+draws per second, the mean latency of a policy selection, and the peak memory
+of the run. Every cell runs in a fresh process, so its peak memory can be read
+from the OS and a cell exceeding its time limit can be stopped. Results are
+saved as JSON, and two result files can be compared cell by cell.
+"""
+
+FIXTURES = ("synthetic", "real", "sparse")
+
+def benchmark_query(m, total_query):
+    """
+    @returns a query asking for an equal share of total_query from each group
+    """
+    return StatTracker(m, initial_count=[max(1, total_query // m)] * m)
+
+def synthetic_fixture(n, m, total_query):
+    """
+    @returns a DT instance over SyntheticSource instances with random costs
+             and group weights
+    """
+    data_sources = [ SyntheticSource(m, 2 * (1 - random.random()),
+                                     [ 1 - random.random() for j in range(m) ])
+                     for i in range(n) ]
+    return DT(m, data_sources, benchmark_query(m, total_query))
+
+def real_fixture(n, m, total_query, surplus=4, sparse=False):
+    """
+    @params
+        surplus: roughly how many times over the sources can answer the
+                 query of every group, so that runs never exhaust a group
+        sparse: whether the sources keep their counts in SparseStatTracker
+                instances
+    @returns a DT instance over ArraySource instances with random costs and
+             disjoint records
+    """
+    query = benchmark_query(m, total_query)
+    data_sources = []
+    next_id = 0
+    for i in range(n):
+        # Each source holds between 0.5 and 1.5 times its share of the
+        # surplus of every group
+        counts = [ math.ceil(surplus * query[j] * (1.5 - random.random()) / n)
+                   for j in range(m) ]
+        groups = np.repeat(np.arange(m), counts)
+        ids = np.arange(next_id, next_id + len(groups), dtype=np.int64)
+        next_id += len(groups)
+        data_sources.append(ArraySource(m, 2 * (1 - random.random()), groups,
+                                        ids, sparse))
+    return DT(m, data_sources, query)
+
+def peak_rss():
+    """
+    @returns the peak resident memory of this process in bytes, or None if
+             it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+def run_benchmark_cell(fixture, policy, n, m, total_query, seed, repeats=1):
+    """
+    Runs a single benchmark cell in the current process. Each repeat runs on
+    a freshly generated copy of the same instance, and the fastest is kept.
+    @returns a dictionary of the cell's coordinates and measurements
+    """
+    start_rss = peak_rss()
+    best = None
+    for _ in range(repeats):
+        random.seed(seed)
+        np.random.seed(seed % (2 ** 32))
+        start = time.perf_counter()
+        if fixture == "synthetic":
+            dt = synthetic_fixture(n, m, total_query)
+            run_kwargs = {"simulate": True}
+        elif fixture == "real":
+            dt = real_fixture(n, m, total_query)
+            run_kwargs = {}
+        elif fixture == "sparse":
+            dt = real_fixture(n, m, total_query, sparse=True)
+            run_kwargs = {}
+        else:
+            raise ValueError("Unknown fixture: " + str(fixture))
+        setup_seconds = time.perf_counter() - start
+        # The fill curve is only sampled once per run, so the overhead of the
+        # trace is the handful of clock reads per draw
+        start = time.perf_counter()
+        cost, iters, trace = dt.run(policy, trace_every=max(1, total_query),
+                                    **run_kwargs)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, setup_seconds, cost, iters, trace)
+    seconds, setup_seconds, cost, iters, trace = best
+    end_rss = peak_rss()
+    picks = int(trace.source_picks.sum())
+    return {
+        "fixture": fixture,
+        "policy": policy,
+        "n": n,
+        "m": m,
+        "total_query": total_query,
+        "seed": seed,
+        "repeats": repeats,
+        "status": "ok",
+        "cost": cost,
+        "iterations": iters,
+        "setup_seconds": setup_seconds,
+        "seconds": seconds,
+        "draws_per_second": iters / seconds if seconds > 0 else None,
+        "select_latency_us": 1e6 * trace.select_time / picks if picks else None,
+        "select_seconds": trace.select_time,
+        "sample_seconds": trace.sample_time,
+        "dedup_seconds": trace.dedup_time,
+        "peak_rss_bytes": end_rss,
+        "run_rss_bytes": (end_rss - start_rss) if end_rss is not None else None,
+    }
+
+def cell_worker(connection, cell):
+    try:
+        connection.send(run_benchmark_cell(*cell))
+    except Exception as e:
+        connection.send({"status": "error", "error": repr(e)})
+    connection.close()
+
+def run_isolated(cell, timeout=None):
+    """
+    Runs a benchmark cell in a fresh process, stopping it after timeout
+    seconds if given.
+    @returns the cell's result dictionary, with status "timeout" or "error"
+             if it did not finish
+    """
+    fixture, policy, n, m, total_query, seed = cell[:6]
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=cell_worker, args=(sender, cell))
+    process.start()
+    sender.close()
+    if receiver.poll(timeout):
+        try:
+            result = receiver.recv()
+        except EOFError: # The worker died, e.g. killed for lack of memory
+            result = {"status": "error", "error": "worker exited with code "
+                                                  + str(process.exitcode)}
+    else:
+        result = {"status": "timeout"}
+    process.terminate()
+    process.join()
+    result.update({ "fixture": fixture, "policy": policy, "n": n, "m": m,
+                    "total_query": total_query, "seed": seed })
+    return result
+
+def cell_key(result):
+    return (result["fixture"], result["policy"], result["n"], result["m"],
+            result["total_query"])
+
+def run_benchmarks(cells, repeats=1, timeout=None, base_seed=0,
+                   out=sys.stdout):
+    """
+    @params
+        cells: an iterable of (fixture, policy, n, m, total_query) tuples
+        repeats: number of timed runs of each cell, the fastest is kept
+        timeout: the time limit of each cell in seconds, over all repeats
+        base_seed: the seed from which every cell's instance is derived
+        out: file-like object a line of progress is written to per cell
+    @returns a dictionary with the environment and the list of cell results
+    """
+    results = []
+    for fixture, policy, n, m, total_query in cells:
+        # Every policy runs on the same instance of a configuration
+        seed = cell_seed(base_seed, (fixture, n, m, total_query), "", 0)
+        result = run_isolated((fixture, policy, n, m, total_query, seed,
+                               repeats), timeout)
+        results.append(result)
+        if out is not None:
+            print(format_result(result), file=out, flush=True)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "base_seed": base_seed,
+        "repeats": repeats,
+        "timeout": timeout,
+        "results": results,
+    }
+
+def format_result(result):
+    s = "%s %s n=%d m=%d q=%d: " % cell_key(result)
+    if result["status"] != "ok":
+        return s + result["status"] + " " + result.get("error", "")
+    s += "%.0f draws/s, select %.2f us, %.2f s" % (
+        result["draws_per_second"] or 0.0, result["select_latency_us"] or 0.0,
+        result["seconds"])
+    if result["peak_rss_bytes"] is not None:
+        s += ", peak %.1f MB" % (result["peak_rss_bytes"] / 2 ** 20)
+    return s
+
+def save_benchmarks(benchmarks, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(benchmarks, f, indent=1)
+
+def load_benchmarks(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_benchmarks(baseline, current, threshold=0.1):
+    """
+    Compares the cells present in both benchmark results.
+    @params
+        threshold: relative change of throughput or latency beyond which a
+                   cell counts as a regression or an improvement
+    @returns a list of (cell key, draws per second ratio, selection latency
+             ratio, verdict) tuples, where ratios are current over baseline
+             and verdict is "regression", "improvement" or "same"
+    """
+    baseline_results = { cell_key(result) : result
+                         for result in baseline["results"]
+                         if result["status"] == "ok" }
+    comparison = []
+    for result in current["results"]:
+        key = cell_key(result)
+        if result["status"] != "ok" or key not in baseline_results:
+            continue
+        base = baseline_results[key]
+        throughput = None
+        if base["draws_per_second"] and result["draws_per_second"]:
+            throughput = result["draws_per_second"] / base["draws_per_second"]
+        latency = None
+        if base["select_latency_us"] and result["select_latency_us"]:
+            latency = result["select_latency_us"] / base["select_latency_us"]
+        verdict = "same"
+        if ((throughput is not None and throughput < 1 - threshold)
+            or (latency is not None and latency > 1 + threshold)):
+            verdict = "regression"
+        elif ((throughput is not None and throughput > 1 + threshold)
+              or (latency is not None and latency < 1 - threshold)):
+            verdict = "improvement"
+        comparison.append((key, throughput, latency, verdict))
+    return comparison
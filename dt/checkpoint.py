@@ -0,0 +1,123 @@
+import array
+import os
+import pickle
+
+"""
+An append-only checkpoint file of a DT run. The file starts with a header
+record describing the run, followed by one record per checkpoint holding the
+small part of the run state in full (counts, cost, random states) and only
+the records collected and the permutation swaps changed since the previous
+checkpoint, so writing a checkpoint takes time in what changed rather than
+in everything collected so far. A
+record cut short by a crash is ignored, and cut off before appending again.
+"""
+
+class RunCheckpoint:
+    def __init__(self, path):
+        """
+        @params
+            path: the checkpoint file, which need not exist yet
+        """
+        self.path = path
+        self.file = None
+
+    def read(self):
+        """
+        @returns a tuple (header, state, sources, positions, permutations),
+                 where state is the last complete checkpoint record, sources
+                 and positions list every collected record of a real source
+                 across all records, and permutations lists the permutation
+                 changes of every record in order; header and state are None
+                 if the file holds no complete header
+        """
+        header = None
+        state = None
+        sources = array.array("q")
+        positions = array.array("q")
+        permutations = []
+        self.end = 0
+        if not os.path.exists(self.path):
+            return header, state, sources, positions, permutations
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    record = pickle.load(f)
+                except Exception: # End of file or a record cut short
+                    break
+                self.end = f.tell()
+                if header is None:
+                    header = record
+                else:
+                    state = record
+                    sources.extend(record["sources"])
+                    positions.extend(record["positions"])
+                    permutations.append(record["permutations"])
+        return header, state, sources, positions, permutations
+
+    def open(self, header=None):
+        """
+        Opens the file for appending after its last complete record, starting
+        a new file with the header if given.
+        """
+        if header is not None:
+            self.file = open(self.path, "wb")
+            self.write(header)
+        else:
+            self.file = open(self.path, "r+b")
+            self.file.truncate(self.end)
+            self.file.seek(self.end)
+
+    def write(self, record):
+        pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+# Test cases
+if __name__ == '__main__':
+    import random
+    import tempfile
+    from .data_point import DataPoint
+    from .dt import DT
+    from .real_source import RealSource
+    from .stat_tracker import StatTracker
+
+    def instance():
+        # Nested sources without replacement, where the query needs every
+        # record of the largest one, so that the smaller ones are drawn
+        # until their permutations start over
+        random.seed(0)
+        points = [ DataPoint(random.randrange(5), j) for j in range(60) ]
+        sources = []
+        for size in [20, 40, 60]:
+            source = RealSource(5, 1.0, replace=False)
+            for point in points[:size]:
+                source.add_point(point)
+            sources.append(source)
+        counts = [ sum([ 1 for point in points if point.group == g ])
+                   for g in range(5) ]
+        return DT(5, sources, StatTracker(5, counts))
+
+    path = os.path.join(tempfile.mkdtemp(), "run.ckpt")
+    for policy in ["random", "ratiocoll-dupe", "epsilon-exact-dupe"]:
+        random.seed(1)
+        expected = instance().run(policy)
+        if os.path.exists(path):
+            os.remove(path)
+        random.seed(1)
+        instance().run(policy, checkpoint=path, checkpoint_every=10)
+        with open(path, "rb") as f:
+            data = f.read()
+        # Resume from the file cut at points throughout the run
+        same = True
+        for cut in range(len(data) // 8, len(data), len(data) // 8):
+            with open(path, "wb") as f:
+                f.write(data[:cut])
+            resumed = instance().run(policy, checkpoint=path,
+                                     checkpoint_every=10)
+            same = same and resumed == expected
+        print(policy, expected, "resumed the same:", same)
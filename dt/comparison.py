@@ -0,0 +1,91 @@
+import math
+import random
+import statistics
+import numpy as np
+from .experiment import *
+
+"""
+Compares policies with common random numbers: in every rep, each policy runs
+on the same problem instance, every data source replays the same random
+stream, and the policies' own random choices start from the same seed. The
+per-rep cost differences against a baseline policy are then far less noisy
+than differences of independent runs, and reps are only added until the
+confidence intervals of all differences are narrow enough.
+"""
+
+def stream_seed(base_seed, rep, i):
+    """
+    @returns the seed of the random stream of the i-th data source in a rep
+    """
+    return cell_seed(base_seed, ("stream", i), "", rep)
+
+def run_common(create_dt, policy, rep, base_seed=0, run_kwargs=None):
+    """
+    Runs a policy on the rep's shared instance and random streams.
+    @returns the total cost and the number of iterations
+    """
+    if run_kwargs is None:
+        run_kwargs = {}
+    seed = cell_seed(base_seed, ("instance",), "", rep)
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    dt = create_dt()
+    for i, ds in enumerate(dt.data_sources):
+        ds.set_stream(stream_seed(base_seed, rep, i))
+    # The policy's own random choices also start from a common state
+    random.seed(cell_seed(base_seed, ("policy",), "", rep))
+    cost, iters = dt.run(policy, **run_kwargs)
+    return cost, iters
+
+def compare_policies(create_dt, policies, precision, confidence=0.95,
+                     min_reps=10, max_reps=1000, base_seed=0, run_kwargs=None):
+    """
+    Runs reps until the confidence interval of the mean paired cost difference
+    between every policy and the baseline (the first policy) has a half-width
+    of at most precision, or max_reps is reached. Intervals use the normal
+    approximation, so min_reps should not be too small.
+    @params
+        create_dt: a function with no arguments returning a fresh DT instance
+        policies: the policy names to compare, the first one is the baseline
+        precision: the target half-width, in cost units
+        confidence: the confidence level of the intervals
+        min_reps: the number of reps run before checking the precision
+        max_reps: the maximum number of reps
+        base_seed: the seed from which all streams are derived
+        run_kwargs: extra keyword arguments passed to DT.run
+    @returns a dictionary with the number of reps and, for each policy, its
+             mean cost and iterations, and its mean difference from the
+             baseline with the interval's half-width
+    """
+    z = statistics.NormalDist().inv_cdf((1.0 + confidence) / 2.0)
+    costs = { policy : [] for policy in policies }
+    iters = { policy : [] for policy in policies }
+    baseline = policies[0]
+
+    def half_width(differences):
+        return z * statistics.stdev(differences) / math.sqrt(len(differences))
+
+    rep = 0
+    while rep < max_reps:
+        for policy in policies:
+            cost, iterations = run_common(create_dt, policy, rep, base_seed,
+                                          run_kwargs)
+            costs[policy].append(cost)
+            iters[policy].append(iterations)
+        rep += 1
+        if rep >= max(min_reps, 2):
+            widths = [ half_width([ a - b for a, b in
+                                    zip(costs[policy], costs[baseline]) ])
+                       for policy in policies[1:] ]
+            if all(width <= precision for width in widths):
+                break
+    result = { "reps": rep, "baseline": baseline, "policies": {} }
+    for policy in policies:
+        differences = [ a - b for a, b in zip(costs[policy], costs[baseline]) ]
+        result["policies"][policy] = {
+            "mean_cost": statistics.mean(costs[policy]),
+            "mean_iters": statistics.mean(iters[policy]),
+            "mean_difference": statistics.mean(differences),
+            "half_width": half_width(differences) if rep > 1 else float('inf'),
+        }
+    return result
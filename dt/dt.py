@@ -1,13 +1,21 @@
+import array
+import asyncio
 import random
-import math
+import time
+from .async_source import *
+from .checkpoint import *
 from .stat_tracker import *
+from .policy import *
+from .score_cache import *
+from .trace import *
 from .utils import *
 
 """
 Represents a single instance of the DT problem. 
 In other words, implements (D, G, C, Q) as a class. 
-Implements the random, CoupColl, RatioColl, and EpsilonGreedy algorithms via 
-the run() function that runs specified algorithm and returns the results. 
+Runs the random, CoupColl, RatioColl, EpsilonGreedy and UCB algorithms, or any
+other registered Policy, via the run() function that runs specified algorithm
+and returns the results. 
 """
 
 class DT:
@@ -21,6 +29,8 @@ class DT:
         self.num_groups = num_groups
         self.data_sources = data_sources
         self.query = query
+        # ScoreCache instances by (probability method, prior weight)
+        self.score_caches = {}
     
     def __str__(self):
         s = "Query: " + str(self.query) + "\n"
@@ -33,174 +43,497 @@ class DT:
         """
         @returns a list of group indices whose query is not satisfied
         """
-        return [ g for g in range(self.num_groups) 
-                 if self.query[g] > self.collected_stats[g] ]
+        return self.collected_stats.unsatisfied_groups()
     
-    def run(self, policy):
+    def run(self, policy, simulate=False, max_batch=1, disjoint=False,
+            trace_every=None, frontier=None, checkpoint=None,
+            checkpoint_every=10000):
+        """
+        @params
+            policy: the name of a registered source selection policy, or a
+                    Policy instance
+            simulate: if True, every data source must be a SyntheticSource
+                      and draws are taken with sample_group(), skipping
+                      DataPoint creation and deduplication since synthetic
+                      draws practically never collide
+            max_batch: the maximum number of draws committed at once, see
+                       Policy.select_batch()
+            disjoint: if True, the data sources must be real sources that
+                      share no data points, and duplicates are detected by
+                      the position of the sampled record within its source
+                      instead of through unified_set
+            trace_every: if given, the run is instrumented with a RunTrace
+                         whose fill curve is recorded every trace_every
+                         iterations
+            frontier: if given, the greedy policies index only the frontier
+                      best sources of every group by cost / probability, see
+                      SourceFrontier, so that their selections take time in
+                      frontier rather than in the number of sources; results
+                      are unchanged
+            checkpoint: if given, the path of a file to which the run state is
+                        appended every checkpoint_every iterations, see
+                        RunCheckpoint; if the file already holds a checkpoint
+                        of the same run, the run resumes from it, and
+                        finishes just as it would have without interruption
+        @returns the total cost and the number of iterations, followed by the
+                 RunTrace if trace_every is given
+        """
+        if simulate and not all(ds.synthetic for ds in self.data_sources):
+            raise ValueError("simulate=True requires synthetic data sources")
+        if disjoint and any(ds.synthetic for ds in self.data_sources):
+            raise ValueError("disjoint=True requires real data sources")
+        if checkpoint is not None:
+            if trace_every is not None:
+                raise ValueError("checkpoint cannot be combined with trace_every")
+            return self.run_checkpointed(policy, simulate, max_batch, disjoint,
+                                         frontier, checkpoint, checkpoint_every)
+        self.reset(policy, disjoint, frontier)
+        if trace_every is not None:
+            return self.run_traced(simulate, max_batch, disjoint, trace_every)
+        # Run the chosen algorithm
+        iteration = 0 # Used for epsilon greedy
+        while self.collected_stats.unsatisfied:
+            batches = self.select_batches(iteration, max_batch)
+            iteration = self.step(iteration, batches, simulate, disjoint)
+            #print(self.remaining_queries_csv(iteration))
+        return self.total_cost, iteration
+
+    def select_batches(self, iteration, max_batch):
+        """
+        @returns the list of (data source, k) pairs the policy selects next
+        """
+        if max_batch > 1:
+            return self.policy.select_batch(iteration, max_batch)
+        return [(self.policy.select(iteration), 1)]
+
+    def step(self, iteration, batches, simulate, disjoint, draw=None,
+             on_batch=None):
+        """
+        Runs one step of the loop shared by run(), run_traced() and
+        run_checkpointed(): draws k points from every selected data source
+        and pays for them.
+        @params
+            iteration: the number of draws before the step
+            batches: the (data source, k) pairs returned by select_batches()
+            simulate, disjoint: as in run()
+            draw: if given, a function called with a data source and k
+                  instead of draw(), which draws from it and collects the new
+                  points
+            on_batch: an optional function called after every batch with the
+                      data source, k, the value returned by draw and the
+                      number of draws so far
+        @returns the number of draws after the step
+        """
+        for selected_source, k in batches:
+            if draw is None:
+                drawn = self.draw(selected_source, k, simulate, disjoint)
+            else:
+                drawn = draw(selected_source, k)
+            if k == 1:
+                self.total_cost += selected_source.cost
+            else:
+                self.total_cost += k * selected_source.cost
+            iteration += k
+            if not selected_source.replace:
+                self.policy.drawn(selected_source, k)
+            if on_batch is not None:
+                on_batch(selected_source, k, drawn, iteration)
+        return iteration
+
+    def draw(self, data_source, k, simulate, disjoint):
+        """
+        Samples k points from the data source and collects the new ones.
+        @returns the list of groups of the new points
+        """
+        samples = self.sample_from(data_source, k, simulate, disjoint)
+        return self.deduplicate(data_source, samples, simulate, disjoint)
+
+    def reset(self, policy, disjoint=False, frontier=None, restore=None):
+        """
+        Resets the sample counts of the data sources and the collected points,
+        and starts the policy for a new run.
+        @params
+            restore: an optional function called with no arguments after the
+                     reset and before the policy starts
+        """
+        self.frontier = frontier
         # Reset any sampling counts already attached to data source
         for data_source in self.data_sources:
             data_source.reset_sample()
         # Reset/initialize variables used
         self.unified_set = set()
-        self.collected_stats = StatTracker(self.num_groups)
+        if disjoint:
+            # One byte per record, set once the record has been collected
+            self.seen_positions = { ds : bytearray(len(ds))
+                                    for ds in self.data_sources }
+        collected_stats = getattr(self, "collected_stats", None)
+        if collected_stats is not None and collected_stats.query is self.query:
+            collected_stats.reset()
+        else:
+            self.collected_stats = QueryTracker(self.query)
         self.total_cost = 0.0
-        # Run the chosen algorithm
-        iteration = 0 # Used for epsilon greedy
-        while not self.query.is_satisfied_by(self.collected_stats):
-            selected_source = self.select(policy, iteration)
-            new_point = selected_source.sample()
-            if new_point not in self.unified_set:
-                self.unified_set.add(new_point)
-                self.collected_stats.add_point(new_point.group)
-                selected_source.unique_sample_stats.add_point(new_point.group)
-            self.total_cost += selected_source.cost
-            iteration += 1
-            #print(self.remaining_queries_csv(iteration))
+        if restore is not None:
+            restore()
+        self.policy = create_policy(policy)
+        self.policy.start(self)
+
+    async def run_async(self, policy, sources=None, max_in_flight=8,
+                        frontier=None):
+        """
+        Runs a policy against sources with real per-draw latency, keeping up
+        to max_in_flight draws outstanding across sources. The policy picks
+        the next source whenever there is room; if that source already has
+        max_concurrency draws in flight, the run waits for some draw to
+        arrive and asks again. Results are collected as they arrive, and
+        never more draws are outstanding than the total remaining query.
+        Every issued draw is paid for, including those still in flight when
+        the query gets satisfied, which are cancelled.
+        @params
+            policy: the name of a registered source selection policy, or a
+                    Policy instance
+            sources: a list of AsyncSource instances matching data_sources
+                     one to one, by default LatencySource instances with no
+                     latency
+            max_in_flight: the maximum number of outstanding draws
+            frontier: the frontier size passed to the policy, see run()
+        @returns the total cost and the number of iterations
+        """
+        if sources is None:
+            sources = [ LatencySource(ds, latency=0.0)
+                        for ds in self.data_sources ]
+        if [ s.source for s in sources ] != list(self.data_sources):
+            raise ValueError("sources must wrap data_sources in order")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.reset(policy, frontier=frontier)
+        source_index = { ds : i for i, ds in enumerate(self.data_sources) }
+        in_flight = [0] * len(self.data_sources)
+        # Outstanding draws as task -> (issue order, source index)
+        pending = {}
+        iteration = 0
+        try:
+            while self.collected_stats.unsatisfied:
+                limit = min(max_in_flight, self.collected_stats.remaining)
+                while len(pending) < limit:
+                    selected_source = self.policy.select(iteration)
+                    i = source_index[selected_source]
+                    if in_flight[i] >= sources[i].max_concurrency:
+                        break
+                    task = asyncio.ensure_future(sources[i].sample())
+                    pending[task] = (iteration, i)
+                    in_flight[i] += 1
+                    self.total_cost += selected_source.cost
+                    iteration += 1
+                done, _ = await asyncio.wait(pending,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                # Collect in issue order so that runs are reproducible
+                for task in sorted(done, key=lambda task: pending[task][0]):
+                    i = pending.pop(task)[1]
+                    in_flight[i] -= 1
+                    data_source = self.data_sources[i]
+                    self.policy.arrived(data_source)
+                    self.deduplicate(data_source, [task.result()], False,
+                                     False)
+                    if not data_source.replace:
+                        self.policy.drawn(data_source, 1)
+                    if not self.collected_stats.unsatisfied:
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
         return self.total_cost, iteration
-    
-    def select(self, policy, iteration):
-        if policy == "random":
-            return random.choice(self.data_sources)
-        elif policy == "coupcoll-nodupe":
-            return self.select_coupcoll(dupe=False)
-        elif policy == "coupcoll-dupe":
-            return self.select_coupcoll(dupe=True)
-        elif policy == "ratiocoll-nodupe":
-            return self.select_ratiocoll(dupe=False)
-        elif policy == "ratiocoll-dupe":
-            return self.select_ratiocoll(dupe=True)
-        elif policy == "epsilon-exact-nodupe":
-            return self.select_epsilongreedy(iteration, bayes=False, dupe=False)
-        elif policy == "epsilon-exact-dupe":
-            return self.select_epsilongreedy(iteration, bayes=False, dupe=True)
-        elif policy == "epsilon-bayes-nodupe":
-            return self.select_epsilongreedy(iteration, bayes=True, dupe=False)
-        elif policy == "epsilon-bayes-dupe":
-            return self.select_epsilongreedy(iteration, bayes=False, dupe=True)
-        elif policy ==  "ucb":
-            return self.select_ucb(iteration)
-    
+
+    def run_queries(self, policy, queries, **run_kwargs):
+        """
+        Tailors many queries over the same groups from one shared stream of
+        samples. A new unique point is routed to every query which still
+        needs its group, so the sources are selected for the combined query
+        of the largest count of every group, see MultiQueryTracker, and the
+        whole batch costs about as much as its most demanding query alone
+        rather than the sum of separate runs.
+        @params
+            policy: as in run()
+            queries: a list of StatTracker instances with the desired counts
+            run_kwargs: any other keyword arguments of run()
+        @returns the results of run(), followed by the MultiQueryTracker
+                 holding the counts of each query in trackers and the number
+                 of unique points collected when each query was satisfied
+                 in satisfied_at
+        """
+        tracker = MultiQueryTracker(queries)
+        query = self.query
+        # reset() reuses the collected stats of the same query
+        self.query = tracker.query
+        self.collected_stats = tracker
+        try:
+            result = self.run(policy, **run_kwargs)
+        finally:
+            self.query = query
+        return result + (tracker,)
+
+    def run_traced(self, simulate, max_batch, disjoint, trace_every):
+        """
+        Same loop as run(), timed and counted into a RunTrace. Kept separate
+        so that untraced runs pay nothing for the instrumentation.
+        """
+        trace = RunTrace(len(self.data_sources), self.num_groups, trace_every)
+        source_index = { ds : i for i, ds in enumerate(self.data_sources) }
+        clock = time.perf_counter
+
+        def draw(data_source, k):
+            start = clock()
+            samples = self.sample_from(data_source, k, simulate, disjoint)
+            sampled = clock()
+            new_groups = self.deduplicate(data_source, samples, simulate,
+                                          disjoint)
+            trace.sample_time += sampled - start
+            trace.dedup_time += clock() - sampled
+            return new_groups
+
+        def on_batch(data_source, k, new_groups, iteration):
+            trace.record_draws(source_index[data_source], k, new_groups,
+                               iteration, self)
+
+        iteration = 0
+        while self.collected_stats.unsatisfied:
+            start = clock()
+            batches = self.select_batches(iteration, max_batch)
+            trace.select_time += clock() - start
+            iteration = self.step(iteration, batches, simulate, disjoint,
+                                  draw, on_batch)
+        return self.total_cost, iteration, trace
+
+    def run_checkpointed(self, policy, simulate, max_batch, disjoint, frontier,
+                         path, every):
+        """
+        Same loop as run(), which also checkpoints the run to path. Real
+        sources are sampled by position, which draws the same random numbers
+        as sampling points, so that their collected records can be saved as
+        (source index, position) pairs.
+        """
+        checkpoint = RunCheckpoint(path)
+        header = {
+            "policy": policy if isinstance(policy, str)
+                      else type(policy).__name__,
+            "simulate": simulate,
+            "max_batch": max_batch,
+            "disjoint": disjoint,
+            "num_groups": self.num_groups,
+            "sources": [ (type(ds).__name__, ds.cost)
+                         for ds in self.data_sources ],
+            "query": [ self.query[g] for g in range(self.num_groups) ],
+        }
+        saved_header, state, sources, positions, permutations = \
+            checkpoint.read()
+        if saved_header is not None and saved_header != header:
+            raise ValueError(str(path) + " holds a checkpoint of another run")
+        iteration = 0
+        if state is None:
+            self.reset(policy, disjoint, frontier)
+            checkpoint.open(header)
+        else:
+            self.reset(policy, disjoint, frontier, lambda: self.restore_state(
+                state, sources, positions, permutations, disjoint))
+            iteration = state["iteration"]
+            if state["done"]:
+                return self.total_cost, iteration
+            checkpoint.open()
+        # Permutations of sources without replacement are saved as changes
+        for ds in self.data_sources:
+            if not ds.replace:
+                ds.permutation.track_changes()
+        source_index = { ds : i for i, ds in enumerate(self.data_sources) }
+        # Real records collected since the last checkpoint
+        sources = array.array("q")
+        positions = array.array("q")
+        next_checkpoint = iteration + every
+
+        def draw(data_source, k):
+            if simulate or data_source.synthetic:
+                # Synthetic points are never drawn twice, so there is nothing
+                # about them to save
+                return self.draw(data_source, k, simulate, disjoint)
+            i = source_index[data_source]
+            for position in self.collect_positions(data_source, k, disjoint):
+                sources.append(i)
+                positions.append(position)
+
+        try:
+            while self.collected_stats.unsatisfied:
+                batches = self.select_batches(iteration, max_batch)
+                iteration = self.step(iteration, batches, simulate,
+                                      disjoint, draw)
+                if iteration >= next_checkpoint:
+                    checkpoint.write(self.checkpoint_state(iteration, sources,
+                                                           positions))
+                    sources = array.array("q")
+                    positions = array.array("q")
+                    next_checkpoint = iteration + every
+            checkpoint.write(self.checkpoint_state(iteration, sources,
+                                                   positions, done=True))
+        finally:
+            checkpoint.close()
+            for ds in self.data_sources:
+                if not ds.replace:
+                    ds.permutation.track_changes(False)
+        return self.total_cost, iteration
+
+    def collect_positions(self, data_source, k, disjoint):
+        """
+        Samples k records of a real source by position and collects the new
+        ones.
+        @returns the positions of the new records
+        """
+        if k == 1:
+            samples = [data_source.sample_position()]
+        else:
+            samples = data_source.sample_position_batch(k)
+        new_positions = []
+        if disjoint:
+            seen = self.seen_positions[data_source]
+            for position, group in samples:
+                if not seen[position]:
+                    seen[position] = 1
+                    new_positions.append(position)
+                    self.collect(data_source, group)
+        else:
+            for position, group in samples:
+                new_point = data_source[position]
+                if new_point not in self.unified_set:
+                    self.unified_set.add(new_point)
+                    new_positions.append(position)
+                    self.collect(data_source, group)
+        return new_positions
+
+    def checkpoint_state(self, iteration, sources, positions, done=False):
+        """
+        @returns a checkpoint record of the run state, with the real records
+                 collected and the permutation changes since the last
+                 checkpoint
+        """
+        return {
+            "iteration": iteration,
+            "done": done,
+            "total_cost": self.total_cost,
+            "collected": self.collected_stats.snapshot(),
+            "sample": [ ds.sample_stats.snapshot()
+                        for ds in self.data_sources ],
+            "unique": [ ds.unique_sample_stats.snapshot()
+                        for ds in self.data_sources ],
+            "random_states": [ ds.get_random_state()
+                               for ds in self.data_sources ],
+            "random": random.getstate(),
+            "sources": sources,
+            "positions": positions,
+            "permutations": [ None if ds.replace
+                              else ds.permutation.get_changes()
+                              for ds in self.data_sources ],
+        }
+
+    def restore_state(self, state, sources, positions, permutations,
+                      disjoint):
+        """
+        Restores the run state of a checkpoint record, given every real record
+        collected and the permutation changes of every record up to it.
+        """
+        self.collected_stats.set_counts(state["collected"])
+        for i, ds in enumerate(self.data_sources):
+            ds.sample_stats.set_counts(state["sample"][i])
+            ds.unique_sample_stats.set_counts(state["unique"][i])
+            ds.set_random_state(state["random_states"][i])
+        for changes in permutations:
+            for i, ds in enumerate(self.data_sources):
+                if changes[i] is not None:
+                    ds.permutation.apply_changes(changes[i])
+        for i, position in zip(sources, positions):
+            data_source = self.data_sources[i]
+            if disjoint:
+                self.seen_positions[data_source][position] = 1
+            else:
+                self.unified_set.add(data_source[position])
+        self.total_cost = state["total_cost"]
+        random.setstate(state["random"])
+
+    def sample_from(self, data_source, k, simulate, disjoint):
+        """
+        Samples k points from the data source.
+        @returns a list of groups if simulate, of (position, group) tuples if
+                 disjoint, and of DataPoint instances otherwise
+        """
+        if simulate:
+            if k == 1:
+                return [data_source.sample_group()]
+            return data_source.sample_group_batch(k)
+        elif disjoint:
+            if k == 1:
+                return [data_source.sample_position()]
+            return data_source.sample_position_batch(k)
+        else:
+            if k == 1:
+                return [data_source.sample()]
+            return data_source.sample_batch(k)
+
+    def deduplicate(self, data_source, samples, simulate, disjoint):
+        """
+        Collects the samples returned by sample_from() that are new.
+        @returns the list of groups of the new points
+        """
+        new_groups = []
+        if simulate:
+            new_groups = samples
+        elif disjoint:
+            seen = self.seen_positions[data_source]
+            for position, group in samples:
+                if not seen[position]:
+                    seen[position] = 1
+                    new_groups.append(group)
+        else:
+            for new_point in samples:
+                if new_point not in self.unified_set:
+                    self.unified_set.add(new_point)
+                    new_groups.append(new_point.group)
+        for group in new_groups:
+            self.collect(data_source, group)
+        return new_groups
+
+    def collect(self, data_source, group):
+        """
+        Records a new unique point of the group sampled from the data source.
+        """
+        self.collected_stats.add_point(group)
+        data_source.unique_sample_stats.add_point(group)
+        self.policy.update(data_source, group)
+
+    def score_cache(self, prob_method="gt-nodupe", prior_weight=20.0):
+        """
+        @returns the refreshed ScoreCache for the probability method
+        """
+        key = (prob_method, prior_weight)
+        cache = self.score_caches.get(key)
+        if cache is None:
+            cache = ScoreCache(self.data_sources, self.num_groups, prob_method,
+                               prior_weight)
+            self.score_caches[key] = cache
+        cache.refresh()
+        return cache
+
     def group_score(self, group, prob_method="gt-nodupe", prior_weight=20.0):
         """
         Computes group score defined as:
             min_{forall D_i \in D}(C_i / P(G_j | D_i))
         for the specified group using the specified probability compute method. 
         """
-        def cost_of_group_in_source(data_source):
-            """
-            @returns C_i / P(G_j | D_i)
-            """
-            prob = data_source.probability(group, method=prob_method, 
-                                           prior_weight=prior_weight)
-            if prob == 0.0:
-                return float('inf')
-            else:
-                return data_source.cost / prob
-        scores_by_source = [ cost_of_group_in_source(data_source)
-                             for data_source in self.data_sources ]
-        return min(scores_by_source)
+        return self.score_cache(prob_method, prior_weight).group_score(group)
     
     def group_maximizing_source(self, group, prob_method="gt-nodupe", prior_weight=20.0):
         """
         @returns the data source which maximizes the expected cost of sampling
                  the specified group
         """
-        expected_costs = { ds : ds.probability(group, method=prob_method,
-                           prior_weight=prior_weight) / ds.cost
-                           for ds in self.data_sources }
-        return argmax(expected_costs)
-
-    def select_coupcoll(self, dupe=False):
-        unsatisfied_groups = self.unsatisfied_groups()
-        if dupe:
-            prob_method = "gt-dupe"
-        else:
-            prob_method = "gt_nodupe"
-        group_scores = { g : self.group_score(g, prob_method=prob_method) 
-                        for g in unsatisfied_groups }
-        chosen_group = argmax(group_scores)
-        chosen_ds = self.group_maximizing_source(chosen_group, prob_method=prob_method)
-        return chosen_ds
-    
-    def select_ratiocoll(self, dupe=False):
-        unsatisfied_groups = self.unsatisfied_groups()
-        if dupe:
-            prob_method = "gt-dupe"
-        else:
-            prob_method = "gt-nodupe"
-        group_scores = { g : self.remaining_query(g) * self.group_score(g, 
-                        prob_method=prob_method) for g in unsatisfied_groups }
-        #for g in unsatisfied_groups:
-        #    print(str(g), str(self.remaining_query(g)), str(self.group_score(g)), str(self.remaining_query(g) * self.group_score(g)))
-        chosen_group = argmax(group_scores)
-        chosen_ds = self.group_maximizing_source(chosen_group, prob_method=prob_method)
-        #print(chosen_group, chosen_ds)
-        #print(str(chosen_group), chosen_ds)
-        return chosen_ds
-
-    def select_dualcoll(self):
-        group_scores = {g : self.remaining_query(g) * self.group_score(g) for g in range(self.num_groups)}
-        ds_scores = { ds : sum([ ds.probability(g) * group_scores[g] for g in range(self.num_groups) ]) for ds in self.data_sources }
-        chosen_ds = argmax(ds_scores)
-        return chosen_ds
-    
-    def select_epsilongreedy(self, iteration, bayes=False, dupe=False): # Change prob method
-        r = random.random()
-        if bayes:
-            if dupe:
-                prob_method = "bayes-dupe"
-            else:
-                prob_method = "bayes-nodupe"
-        else:
-            if dupe:
-                prob_method = "sample-dupe"
-            else:
-                prob_method = "sample-nodupe"
-        if (iteration < len(self.data_sources)):
-            return self.data_sources[iteration]
-        elif (r <= math.pow(math.log(iteration) / iteration, 1/3)): # Explore
-            return random.choice(self.data_sources)
-        else: # Exploit
-            unsatisfied_groups = self.unsatisfied_groups()
-            group_scores = { g : self.remaining_query(g) * self.group_score(g, 
-                             prob_method=prob_method) for g in unsatisfied_groups }
-            chosen_group = argmax(group_scores)
-            return self.group_maximizing_source(chosen_group, prob_method=prob_method)
-    
-    def select_ucb(self, iteration):
-        # Memoize total counts for each group
-        if iteration == 0:
-            total_group_counts = [0] * self.num_groups
-            total_count = 0
-            for g in range(self.num_groups):
-                for ds in self.data_sources:
-                    if ds.synthetic: # Synthetic DS doesn't have a "count"
-                        count = ds.probability(g)
-                    else:
-                        count = ds.count(g)
-                    total_group_counts[g] += count
-                    total_count += count
-            self.ucb_rewards = [ total_count / total_group_counts[j] for j in range(self.num_groups) ]
-        # Initialization rounds
-        if iteration < len(self.data_sources):
-            return self.data_sources[iteration]
-        else:
-            # Estimated reward from each data source
-            unsatisfied_groups = self.unsatisfied_groups()
-            avg_rewards = [ 1.0 / (len(ds.sample_stats) * ds.cost) for ds in self.data_sources ]
-            for i in range(len(self.data_sources)):
-                mult = 1.0
-                for group in unsatisfied_groups:
-                    ds = self.data_sources[i]
-                    mult += (ds.sample_stats[group]) / self.ucb_rewards[group]
-                avg_rewards[i] *= mult
-            # UCB logic
-            rewards_range = max(avg_rewards) - min(avg_rewards)
-            upper_bounds = { ds : avg_rewards[ds] + rewards_range * math.sqrt(2 
-                * math.log(iteration) / len(self.data_sources[ds].sample_stats)) for ds in range(len(self.data_sources)) }
-            #print(avg_rewards, upper_bounds)
-            chosen_ds = argmax(upper_bounds)
-            return self.data_sources[chosen_ds]
+        cache = self.score_cache(prob_method, prior_weight)
+        return cache.group_maximizing_source(group)
 
     def remaining_queries_csv(self, iteration):
         s = str(iteration) + ","
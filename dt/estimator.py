@@ -1,7 +1,9 @@
 import math
+import numpy as np
 
 """
 Contains functions which compute the Union Bound and the asymptotic estimate when parameters are specified.
+Also contains an exact calculator of the expected cost of a policy for small synthetic instances.
 """
 
 def union_bound(dt):
@@ -20,3 +22,115 @@ def asymptotic_estimate(dt):
         optimal_probs.append(max(prob_by_source))
     c = sum(optimal_probs) / math.sqrt(2 * math.pi * math.prod(optimal_probs))
     return q + math.sqrt(q) * c
+
+# Policies whose expected cost exact_estimate() computes
+EXACT_POLICIES = ("random", "coupcoll-nodupe", "coupcoll-dupe",
+                  "ratiocoll-nodupe", "ratiocoll-dupe")
+
+def exact_estimate(dt, policy="ratiocoll-nodupe"):
+    """
+    Computes the exact expected cost and number of iterations of running a
+    policy on a DT instance over synthetic data sources, by dynamic
+    programming over the remaining query of every group. Ties are broken
+    uniformly at random as in DT.run. The states are swept by their total
+    remaining query, each level at once with NumPy from the level below, and
+    only the last level is kept, so for two groups time is O(q1 * q2) in
+    vector operations and memory is O(q1).
+    @params
+        dt: a DT instance whose data sources are SyntheticSource instances
+        policy: one of EXACT_POLICIES
+    @returns a tuple (expected cost, expected iterations)
+    """
+    if policy not in EXACT_POLICIES:
+        raise ValueError("exact_estimate does not support policy: "
+                         + str(policy))
+    n = len(dt.data_sources)
+    m = dt.num_groups
+    costs = np.array([ ds.cost for ds in dt.data_sources ], dtype=float)
+    probs = np.array([ [ ds.probability(g, method="gt-nodupe")
+                         for g in range(m) ] for ds in dt.data_sources ],
+                     dtype=float).reshape(n, m)
+    weighted = policy.startswith("ratiocoll")
+    # Group scores and cost-effective sources exactly as DT.group_score and
+    # DT.group_maximizing_source compute them, where choice[g, i] is the
+    # probability of picking source i once group g is chosen
+    min_costs = []
+    choice = np.zeros((m, n))
+    for g in range(m):
+        cost_by_source = [ float('inf') if probs[i, g] == 0.0
+                           else costs[i] / probs[i, g] for i in range(n) ]
+        min_costs.append(min(cost_by_source))
+        ratios = [ probs[i, g] / costs[i] for i in range(n) ]
+        best = [ i for i in range(n) if ratios[i] >= max(ratios) ]
+        choice[g, best] = 1.0 / len(best)
+    # The expected cost of a draw, and its probability of hitting every
+    # group, once group g is chosen
+    choice_costs = (choice @ costs).tolist()
+    choice_probs = (choice @ probs).tolist()
+
+    def draw(remaining, unsatisfied):
+        """
+        @returns the expected cost of the next draw in every state, and the
+                 list of the probability of hitting every group
+        """
+        if policy == "random":
+            return (np.full(len(remaining[0]), costs.mean()),
+                    [ np.full(len(remaining[0]), p) for p in probs.mean(0) ])
+        with np.errstate(invalid="ignore"):
+            scores = [ np.where(unsatisfied[g], remaining[g] * min_costs[g]
+                                if weighted else min_costs[g], float('-inf'))
+                       for g in range(m) ]
+        top = scores[0]
+        for g in range(1, m):
+            top = np.maximum(top, scores[g])
+        tied = [ scores[g] >= top for g in range(m) ]
+        count = sum(tied)
+        # Groups tied for the highest score are chosen uniformly
+        shares = [ tied[g] / count for g in range(m) ]
+        cost = sum([ shares[g] * choice_costs[g] for g in range(m) ])
+        hits = [ sum([ shares[g] * choice_probs[g][h] for g in range(m) ])
+                 for h in range(m) ]
+        return cost, hits
+
+    query = [ dt.query[g] for g in range(m) ]
+    # A state is identified by the remaining queries of all groups but the
+    # last, the last one following from the level; lead[g][j] holds that of
+    # group g in state j, in the order of the flat index j
+    lead_shape = tuple(q + 1 for q in query[:-1])
+    cells = list(np.ndindex(*lead_shape))
+    lead = np.array(cells, dtype=np.int64).reshape(len(cells), m - 1)
+    lead_sum = lead.sum(axis=1)
+    lead = [ np.ascontiguousarray(lead[:, g]) for g in range(m - 1) ]
+    strides = [ int(np.prod(lead_shape[g + 1:], dtype=np.int64))
+                for g in range(m - 1) ]
+    # Expected cost and iterations of every state of the level below
+    expected_cost = np.zeros(len(cells))
+    expected_iters = np.zeros(len(cells))
+    for level in range(1, sum(query) + 1):
+        last = level - lead_sum
+        index = np.flatnonzero((last >= 0) & (last <= query[-1]))
+        remaining = [ column[index] for column in lead ] + [last[index]]
+        unsatisfied = [ column > 0 for column in remaining ]
+        cost, hits = draw(remaining, unsatisfied)
+        iters = 1.0
+        stay = 0.0 # Probability that a draw makes no progress
+        # Every successor is in the level below, at the same flat index but
+        # one stride lower if it drew from one of the leading groups
+        for g in range(m):
+            successor = index - strides[g] if g < m - 1 else index
+            successor = np.where(unsatisfied[g], successor, 0)
+            with np.errstate(invalid="ignore"):
+                cost = cost + np.where(unsatisfied[g],
+                    hits[g] * expected_cost[successor], 0.0)
+                iters = iters + np.where(unsatisfied[g],
+                    hits[g] * expected_iters[successor], 0.0)
+            stay = stay + np.where(unsatisfied[g], 0.0, hits[g])
+        expected_cost = np.zeros(len(cells))
+        expected_iters = np.zeros(len(cells))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected_cost[index] = np.where(stay >= 1.0, float('inf'),
+                                            cost / (1.0 - stay))
+            expected_iters[index] = np.where(stay >= 1.0, float('inf'),
+                                             iters / (1.0 - stay))
+    start = sum(q * stride for q, stride in zip(query, strides))
+    return float(expected_cost[start]), float(expected_iters[start])
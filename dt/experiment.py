@@ -0,0 +1,119 @@
+import hashlib
+import random
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+
+"""
+Runs an experiment grid of (config, policy, rep) cells on a process pool.
+Each cell is seeded deterministically from its own coordinates, so any single
+cell can be reproduced in isolation regardless of scheduling, and averaged
+results are written as CSV rows as soon as all reps of a (config, policy) pair
+have finished. With a ResultsStore, every finished cell is also saved, and
+cells already in the store are not run again, so an interrupted grid picks up
+where it stopped.
+"""
+
+def cell_seed(base_seed, config, policy, rep):
+    """
+    @returns a 64-bit seed derived only from the cell's coordinates
+    """
+    key = repr((base_seed, tuple(config), policy, rep)).encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], 'little')
+
+def run_cell(cell):
+    """
+    Runs a single experiment cell. Must be a module-level function so that it
+    can be sent to worker processes.
+    @params
+        cell: a tuple (create_dt, config, policy, rep, seed, run_kwargs)
+    @returns a tuple (config, policy, rep, seed, total_cost, iterations,
+             seconds)
+    """
+    create_dt, config, policy, rep, seed, run_kwargs = cell
+    start = time.perf_counter()
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    dt = create_dt(*config)
+    cost, iters = dt.run(policy, **run_kwargs)
+    return (config, policy, rep, seed, cost, iters,
+            time.perf_counter() - start)
+
+def run_grid(create_dt, configs, policies, reps, config_columns,
+             stat_columns=("avg_cost", "avg_iters"), format_config=None,
+             policy_names=None, processes=None, base_seed=0, run_kwargs=None,
+             out=sys.stdout, write_header=True, store=None, experiment=None):
+    """
+    @params
+        create_dt: a module-level function taking the values of a config as
+                   positional arguments and returning a fresh DT instance
+        configs: an iterable of parameter tuples
+        policies: the policy names passed to DT.run
+        reps: number of repetitions for each (config, policy) pair
+        config_columns: CSV column names for the config values
+        stat_columns: which of "avg_cost" and "avg_iters" to output
+        format_config: a function from config to a list of CSV values,
+                       defaults to str() of each value
+        policy_names: an optional mapping from policy to its CSV name
+        processes: size of the process pool, 1 runs in-process, None uses
+                   every available core
+        base_seed: the seed from which every cell seed is derived
+        run_kwargs: extra keyword arguments passed to DT.run
+        out: file-like object the CSV is written to
+        write_header: whether to write the CSV header row first
+        store: an optional ResultsStore every finished cell is added to, and
+               whose cells are reused instead of being run again
+        experiment: the name of the grid in the store
+    """
+    if store is not None and experiment is None:
+        raise ValueError("a results store needs an experiment name")
+    configs = [ tuple(config) for config in configs ]
+    if format_config is None:
+        format_config = lambda config: [ str(value) for value in config ]
+    if policy_names is None:
+        policy_names = {}
+    if run_kwargs is None:
+        run_kwargs = {}
+    cells = [ (create_dt, config, policy, rep,
+               cell_seed(base_seed, config, policy, rep), run_kwargs)
+              for config in configs for policy in policies
+              for rep in range(reps) ]
+    if write_header:
+        print(",".join(list(config_columns) + ["policy"] + list(stat_columns)),
+              file=out, flush=True)
+    # (config, policy) -> [finished reps, cost sum, iteration sum]
+    totals = { (config, policy) : [0, 0.0, 0]
+               for config in configs for policy in policies }
+    def record(result):
+        config, policy, rep, seed, cost, iters, seconds = result
+        if store is not None and seconds is not None:
+            store.add(experiment, config, policy, rep, seed, cost, iters,
+                      seconds)
+        total = totals[(config, policy)]
+        total[0] += 1
+        total[1] += cost
+        total[2] += iters
+        if total[0] == reps:
+            stats = { "avg_cost": total[1] / reps, "avg_iters": total[2] / reps }
+            row = format_config(config) + [policy_names.get(policy, policy)]
+            row += [ str(stats[column]) for column in stat_columns ]
+            print(",".join(row), file=out, flush=True)
+    if store is not None:
+        stored = store.results(experiment)
+        remaining = []
+        for cell in cells:
+            config, policy, rep, seed = cell[1:5]
+            result = stored.get((config, policy, rep, seed))
+            if result is None:
+                remaining.append(cell)
+            else:
+                record((config, policy, rep, seed) + result + (None,))
+        cells = remaining
+    if processes == 1:
+        for cell in cells:
+            record(run_cell(cell))
+    else:
+        with Pool(processes) as pool:
+            for result in pool.imap_unordered(run_cell, cells):
+                record(result)
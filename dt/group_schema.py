@@ -0,0 +1,232 @@
+import json
+import os
+import numpy as np
+try:
+    import pandas as pd
+except ImportError: # Only used to find distinct values faster
+    pd = None
+
+"""
+Defines groups as the combinations of the values of one or more categorical
+attributes, such as state x carrier x delay bucket. Each attribute has a
+number of levels, several values may share a level (a state's name and its
+abbreviation), and the group of a combination of levels is its index in the
+mixed-radix product of all attributes, the last attribute varying fastest.
+Whole columns are encoded at once: each attribute's distinct values are
+looked up once and broadcast back to the rows, so encoding millions of rows
+takes time in NumPy rather than a Python loop per row. Schemas are saved as
+JSON next to the sources whose groups they define.
+"""
+
+SCHEMA_FILE_NAME = "schema.json"
+
+class GroupSchema:
+    def __init__(self, attributes):
+        """
+        @params
+            attributes: a list of (name, levels) pairs, one per attribute,
+                        where levels is either a list of the attribute's
+                        values, each its own level, or a dict from value to
+                        level index, so that values can share a level
+        """
+        if not attributes:
+            raise ValueError("a group schema needs at least one attribute")
+        self.names = []
+        # levels[a] maps every value of attribute a to its level, and
+        # values[a][l] is the first value with level l
+        self.levels = []
+        self.values = []
+        self.sizes = []
+        for name, levels in attributes:
+            if not isinstance(levels, dict):
+                levels = { value : level for level, value in enumerate(levels) }
+            size = max(levels.values(), default=-1) + 1
+            values = [None] * size
+            for value, level in levels.items():
+                if values[level] is None:
+                    values[level] = value
+            self.names.append(name)
+            self.levels.append(levels)
+            self.values.append(values)
+            self.sizes.append(size)
+        # strides[a] is the group distance between consecutive levels of a
+        self.strides = [1] * len(self.sizes)
+        for a in range(len(self.sizes) - 2, -1, -1):
+            self.strides[a] = self.strides[a + 1] * self.sizes[a + 1]
+        self.num_groups = int(np.prod(self.sizes, dtype=np.int64))
+        self.group_dtype = np.min_scalar_type(max(self.num_groups - 1, 0))
+
+    @classmethod
+    def fit(cls, columns, names):
+        """
+        @params
+            columns: a mapping from attribute name to column, such as a
+                     pandas DataFrame
+            names: the attributes defining the groups
+        @returns a schema whose levels are the sorted distinct values of each
+                 column
+        """
+        return cls([ (name, distinct_values(columns[name])) for name in names ])
+
+    def __str__(self):
+        return "{Attributes: " + str(self.names) + ", Sizes: " + \
+               str(self.sizes) + ", Groups: " + str(self.num_groups) + "}"
+
+    def __repr__(self):
+        return str(self)
+
+    def encode_attribute(self, a, column):
+        """
+        @returns the int64 array of the level of every value of the column
+                 for attribute a
+        """
+        values, codes = factorize(column)
+        if (codes < 0).any():
+            raise ValueError("missing values of " + str(self.names[a]))
+        levels = self.levels[a]
+        unknown = [ value for value in values if value not in levels ]
+        if unknown:
+            raise ValueError("unknown values of " + str(self.names[a]) + ": "
+                             + str(unknown[:10]))
+        lookup = np.array([ levels[value] for value in values ], dtype=np.int64)
+        return lookup[codes]
+
+    def encode(self, columns):
+        """
+        @params
+            columns: a mapping from attribute name to a column of the value
+                     of every row, such as a pandas DataFrame
+        @returns the array of the group of every row, in the smallest
+                 unsigned dtype holding every group, as taken by
+                 ArraySource.add_arrays()
+        """
+        groups = None
+        for a, name in enumerate(self.names):
+            levels = self.encode_attribute(a, columns[name])
+            if self.strides[a] != 1:
+                levels *= self.strides[a]
+            if groups is None:
+                groups = levels
+            else:
+                groups += levels
+        return groups.astype(self.group_dtype)
+
+    def group(self, values):
+        """
+        @params
+            values: a sequence of one value per attribute
+        @returns the group of the combination of values
+        """
+        return sum(levels[value] * stride for levels, stride, value
+                   in zip(self.levels, self.strides, values))
+
+    def decode(self, group):
+        """
+        @returns the tuple of the first value of each attribute's level in
+                 the group
+        """
+        return tuple(values[group // stride % size] for values, stride, size
+                     in zip(self.values, self.strides, self.sizes))
+
+    def save(self, path):
+        attributes = [ { "name": name,
+                         "levels": [ [to_json(value), level]
+                                     for value, level in levels.items() ] }
+                       for name, levels in zip(self.names, self.levels) ]
+        with open(path, "w") as f:
+            json.dump({ "attributes": attributes }, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            attributes = json.load(f)["attributes"]
+        return cls([ (attribute["name"],
+                      { value : level for value, level in attribute["levels"] })
+                     for attribute in attributes ])
+
+def factorize(column):
+    """
+    @returns a tuple (values, codes) of the list of distinct values of a
+             column and the array of the index in values of every row's
+             value, -1 for missing values
+    """
+    if hasattr(column, "cat"): # A pandas categorical Series
+        return column.cat.categories.tolist(), column.cat.codes.to_numpy()
+    column = np.asarray(column)
+    if pd is not None:
+        # Hashes instead of sorting, which is much faster for strings
+        codes, values = pd.factorize(column)
+        return values.tolist(), codes
+    values, codes = np.unique(column, return_inverse=True)
+    return values.tolist(), codes.reshape(-1)
+
+def distinct_values(column):
+    """
+    @returns the sorted list of distinct values of a column
+    """
+    values, codes = factorize(column)
+    return sorted(values)
+
+def to_json(value):
+    # NumPy scalars are not JSON serializable
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def add_to_sources(sources, keys, groups, ids, new_source, labels=None):
+    """
+    Appends records to the sources of their keys, such as each flight to
+    the source of its carrier, with one sort of the keys instead of one scan
+    of all records per source. Records keep their relative order.
+    @params
+        sources: a dict from key to ArraySource, to which new_source(key) is
+                 added for every new key
+        keys: an array-like of the key of every record
+        groups: an array-like of the group of every record
+        ids: an array-like of the id of every record
+        new_source: a function from a key to a new empty ArraySource
+        labels: if given, keys are indices into labels, which holds the
+                actual keys, such as the codes and categories of a pandas
+                categorical, and records with a negative key are skipped
+    """
+    keys = np.asarray(keys)
+    groups = np.asarray(groups)
+    ids = np.asarray(ids)
+    order = np.argsort(keys, kind="stable")
+    distinct, starts = np.unique(keys[order], return_index=True)
+    ends = np.append(starts[1:], len(keys))
+    for key, start, end in zip(distinct.tolist(), starts, ends):
+        if labels is not None:
+            if key < 0: # Missing from a pandas categorical
+                continue
+            key = labels[key]
+        rows = order[start:end]
+        if key not in sources:
+            sources[key] = new_source(key)
+        sources[key].add_arrays(groups[rows], ids[rows])
+
+def save_schema(schema, directory):
+    """
+    Saves the schema next to the sources saved in the directory.
+    """
+    schema.save(os.path.join(directory, SCHEMA_FILE_NAME))
+
+def open_schema(directory):
+    """
+    @returns the schema saved by save_schema() in the directory, or None
+    """
+    path = os.path.join(directory, SCHEMA_FILE_NAME)
+    if not os.path.exists(path):
+        return None
+    return GroupSchema.load(path)
+
+# Test cases
+if __name__ == '__main__':
+    schema = GroupSchema([("state", {"Alabama": 0, "AL": 0, "Alaska": 1}),
+                          ("delayed", [False, True])])
+    print(schema)
+    groups = schema.encode({"state": ["AL", "Alaska", "Alabama"],
+                            "delayed": [True, False, False]})
+    print(groups)
+    print([ schema.decode(g) for g in groups ])
+    print(schema.group(("Alaska", True)))
@@ -0,0 +1,296 @@
+import heapq
+import random
+import numpy as np
+from .source_frontier import *
+
+"""
+Incrementally maintained group scores for the CoupColl and RatioColl policies.
+Keeps, for every group, the table of C_i / P(G_j | D_i) over all data sources
+along with its minimum, and a priority queue over the (optionally weighted by
+the remaining query) group scores. After each sample only the entries touched
+by that sample are recomputed, so selection no longer rescans every source for
+every unsatisfied group. Decisions, including random tie-breaking, are
+identical to recomputing DT.group_score for every unsatisfied group and
+picking DT.group_maximizing_source for the best one. With a frontier size,
+the per-group minimum and best sources come from SourceFrontier indexes, so
+updates no longer scan every source either.
+
+With sparse sources, the tables of a group are only built once the group is
+unsatisfied or one of its points was collected, so the cost of a run grows
+with the number of groups it touches instead of with the number of groups.
+Sparse sources do not use frontiers, since the tables of a group hold only n
+entries.
+"""
+
+class GroupScorer:
+    def __init__(self, dt, prob_method="gt-nodupe", weighted=True,
+                 frontier=None):
+        """
+        @params
+            dt: the DT instance being run, whose collected_stats must already
+                be initialized
+            prob_method: the probability method passed to each data source
+            weighted: if True, groups are prioritized by
+                      remaining_query(g) * group_score(g) (RatioColl),
+                      otherwise by group_score(g) alone (CoupColl)
+            frontier: if given, the number of best sources kept per group in
+                      the SourceFrontier indexes
+        """
+        self.dt = dt
+        self.prob_method = prob_method
+        self.weighted = weighted
+        # Only the "-dupe" methods depend on the unique sample counts, which
+        # are the only per-source stats that change in a way we must track
+        self.dupe = prob_method.endswith("-dupe")
+        self.source_index = { ds : i for i, ds in enumerate(dt.data_sources) }
+        self.probs = [ ds.probability_function(prob_method)
+                       for ds in dt.data_sources ]
+        self.sparse = any(ds.sparse for ds in dt.data_sources)
+        # A draw without replacement changes the probability of every group
+        # left in the source, which are the groups listed here
+        self.source_groups = [ None if ds.replace else
+                               [ g for g, count in ds.gt_stats.items() ]
+                               for ds in dt.data_sources ]
+        self.min_costs = [0.0] * dt.num_groups
+        self.best_sources = [None] * dt.num_groups
+        # Max-heap (via negated keys) of (-key, group, version) entries; an
+        # entry is stale once its version no longer matches the group's
+        self.versions = [0] * dt.num_groups
+        self.heap = []
+        if self.sparse:
+            self.cost_tables = {}
+            self.ratio_tables = {}
+            self.cost_frontier = None
+            self.ratio_frontier = None
+            for g in dt.unsatisfied_groups():
+                self.build_tables(g)
+                self.refresh_group(g)
+                self.push(g)
+            return
+        # cost_tables[g][i] = C_i / P(G_g | D_i) and
+        # ratio_tables[g][i] = P(G_g | D_i) / C_i, built from the probability
+        # vectors of all sources at once
+        probs = np.array([ ds.probabilities_function(prob_method)()
+                           for ds in dt.data_sources ], dtype=float)
+        probs = probs.reshape(len(dt.data_sources), dt.num_groups)
+        costs = np.array([ ds.cost for ds in dt.data_sources ])[:, None]
+        cost_tables = np.full(probs.shape, float('inf'))
+        np.divide(costs, probs, out=cost_tables, where=probs != 0.0)
+        self.cost_tables = cost_tables.T.tolist()
+        self.ratio_tables = (probs / costs).T.tolist()
+        if frontier is not None:
+            n = len(dt.data_sources)
+            self.cost_frontier = SourceFrontier(n, dt.num_groups,
+                lambda g, i: -self.cost_tables[g][i], frontier)
+            self.ratio_frontier = SourceFrontier(n, dt.num_groups,
+                lambda g, i: self.ratio_tables[g][i], frontier)
+        else:
+            self.cost_frontier = None
+            self.ratio_frontier = None
+        for g in range(dt.num_groups):
+            self.refresh_group(g)
+        for g in dt.unsatisfied_groups():
+            self.push(g)
+
+    def compute_entry(self, group, i):
+        """
+        Recomputes the cost and ratio tables for a single (group, source) pair
+        exactly as DT.group_score and DT.group_maximizing_source would.
+        """
+        ds = self.dt.data_sources[i]
+        prob = self.probs[i](group)
+        if prob == 0.0:
+            self.cost_tables[group][i] = float('inf')
+        else:
+            self.cost_tables[group][i] = ds.cost / prob
+        self.ratio_tables[group][i] = prob / ds.cost
+
+    def build_tables(self, group):
+        """
+        Computes the cost and ratio tables of a group over all sources.
+        """
+        n = len(self.dt.data_sources)
+        self.cost_tables[group] = [0.0] * n
+        self.ratio_tables[group] = [0.0] * n
+        for i in range(n):
+            self.compute_entry(group, i)
+
+    def refresh_group(self, group):
+        """
+        Recomputes the group score and the set of sources maximizing
+        P(G_j | D_i) / C_i for the specified group.
+        """
+        if self.cost_frontier is not None:
+            self.min_costs[group] = -self.cost_frontier.top(group)
+            self.best_sources[group] = self.ratio_frontier.best(group)[1]
+            return
+        self.min_costs[group] = min(self.cost_tables[group])
+        ratios = self.ratio_tables[group]
+        max_ratio = max(ratios)
+        self.best_sources[group] = [ i for i in range(len(ratios))
+                                     if ratios[i] >= max_ratio ]
+
+    def key(self, group):
+        if self.weighted:
+            return self.dt.remaining_query(group) * self.min_costs[group]
+        else:
+            return self.min_costs[group]
+
+    def push(self, group):
+        heapq.heappush(self.heap, (-self.key(group), group, self.versions[group]))
+
+    def is_stale(self, entry):
+        return entry[2] != self.versions[entry[1]]
+
+    def top_entries(self):
+        """
+        @returns the live heap entries tied for the maximum priority, sorted
+                 by group to match the order of unsatisfied_groups(), and the
+                 highest priority among all other groups
+        """
+        heap = self.heap
+        while self.is_stale(heap[0]):
+            heapq.heappop(heap)
+        top = heap[0][0]
+        tied = []
+        while heap and heap[0][0] == top:
+            entry = heapq.heappop(heap)
+            if not self.is_stale(entry):
+                tied.append(entry)
+        while heap and self.is_stale(heap[0]):
+            heapq.heappop(heap)
+        if heap:
+            runner_up = -heap[0][0]
+        else:
+            runner_up = float('-inf')
+        for entry in tied:
+            heapq.heappush(heap, entry)
+        return tied, runner_up
+
+    def select(self):
+        """
+        @returns the data source maximizing the expected cost of sampling the
+                 highest-priority unsatisfied group, ties broken randomly
+        """
+        tied, runner_up = self.top_entries()
+        chosen_group = random.choice([ entry[1] for entry in tied ])
+        chosen_ds = random.choice(self.best_sources[chosen_group])
+        return self.dt.data_sources[chosen_ds]
+
+    def select_batch(self, limit):
+        """
+        Finds how many of the next draws select() would assign to the same
+        source whatever their outcomes. This holds while the top group stays
+        the unique maximum even if every draw hits it, and only for
+        probability methods that ignore duplicates. 
+        @params
+            limit: the maximum number of draws, at least 1
+        @returns a tuple (data source, number of draws)
+        """
+        tied, runner_up = self.top_entries()
+        group = tied[0][1]
+        if self.dupe or len(tied) > 1 or len(self.best_sources[group]) > 1:
+            return self.select(), 1
+        k = min(limit, self.dt.remaining_query(group))
+        if self.weighted:
+            remaining = self.dt.remaining_query(group)
+            score = self.min_costs[group]
+            if score <= 0.0:
+                k = 1
+            elif score != float('inf') and runner_up != float('-inf'):
+                k = min(k, max(1, int((remaining * score - runner_up) / score)))
+                # The d-th draw is decided after up to d - 1 hits of the group
+                while k > 1 and (remaining - (k - 1)) * score <= runner_up:
+                    k -= 1
+        return self.dt.data_sources[self.best_sources[group][0]], k
+
+    def update(self, data_source, group):
+        """
+        Updates the tables after a new unique point of the specified group was
+        collected from the specified data source.
+        """
+        if self.dupe:
+            i = self.source_index[data_source]
+            # Sources without replacement are updated by drawn() instead
+            if self.source_groups[i] is None:
+                self.update_entry(group, i)
+        self.requeue(group)
+
+    def drawn(self, data_source):
+        """
+        Updates the tables after draws from a data source without replacement,
+        which change the probability of every group left in the source
+        whether or not the drawn points were new.
+        """
+        if not self.dupe:
+            return
+        i = self.source_index[data_source]
+        # Groups already satisfied are never looked at again
+        for g in self.source_groups[i]:
+            if self.dt.remaining_query(g) > 0:
+                self.update_entry(g, i)
+                self.requeue(g)
+
+    def update_entry(self, group, i):
+        """
+        Recomputes the entry of source i in the tables of the group, and the
+        group's score.
+        """
+        if self.sparse and group not in self.cost_tables:
+            self.build_tables(group)
+        else:
+            self.compute_entry(group, i)
+        if self.cost_frontier is not None:
+            self.cost_frontier.update(group, i)
+            self.ratio_frontier.update(group, i)
+        self.refresh_group(group)
+
+    def requeue(self, group):
+        """
+        Invalidates the group's current entry and requeues it if still needed.
+        """
+        self.versions[group] += 1
+        if self.dt.remaining_query(group) > 0:
+            self.push(group)
+            # Drop stale entries once they outnumber the live ones
+            live = len(self.dt.collected_stats.unsatisfied)
+            if len(self.heap) > 4 * live + 64:
+                self.heap = [ entry for entry in self.heap
+                              if not self.is_stale(entry) ]
+                heapq.heapify(self.heap)
+
+# Test cases
+if __name__ == '__main__':
+    from .data_point import DataPoint
+    from .dt import DT
+    from .real_source import RealSource
+    from .stat_tracker import StatTracker
+    # Overlapping sources without replacement, so that many draws are
+    # duplicates of points collected from another source
+    random.seed(0)
+    num_groups = 30
+    points = [ DataPoint(random.randrange(num_groups), j) for j in range(3000) ]
+    sources = []
+    for i in range(3):
+        source = RealSource(num_groups, random.uniform(0.5, 2.0), replace=False)
+        for point in points[i * 500:i * 500 + 2000]:
+            source.add_point(point)
+        sources.append(source)
+    query = StatTracker(num_groups, [ random.randint(10, 40)
+                                      for g in range(num_groups) ])
+    for policy in ["coupcoll-dupe", "ratiocoll-dupe"]:
+        dt = DT(num_groups, sources, query)
+        dt.reset(policy)
+        scorer = dt.policy.scorer
+        iteration = 0
+        bad = 0
+        while dt.collected_stats.unsatisfied:
+            batches = dt.select_batches(iteration, 1)
+            iteration = dt.step(iteration, batches, False, False)
+            # Compare with the scores recomputed from scratch
+            fresh = GroupScorer(dt, scorer.prob_method, scorer.weighted)
+            for g in dt.unsatisfied_groups():
+                if scorer.min_costs[g] != fresh.min_costs[g] or \
+                   scorer.best_sources[g] != fresh.best_sources[g]:
+                    bad += 1
+        print(policy, "iterations", iteration, "stale entries", bad)
@@ -0,0 +1,123 @@
+"""
+A random permutation drawn one element at a time, for sampling the records
+of a source without replacement. It is a Fisher-Yates shuffle which only
+stores the positions whose element was swapped away from its initial one, so
+no upfront shuffle of the whole source is needed, each draw takes constant
+time and memory grows with the number of draws rather than with the size.
+Once track_changes() was called, the positions changed by every draw are
+remembered, so that checkpoints can save only the swaps changed since the
+previous one, see get_changes().
+"""
+
+class LazyPermutation:
+    __slots__ = ("drawn", "swaps", "changed", "cleared")
+
+    def __init__(self):
+        # Number of elements drawn; the undrawn ones are those at positions
+        # drawn and beyond
+        self.drawn = 0
+        # Element at each position whose element is not its own position
+        self.swaps = {}
+        # Positions whose element changed since the last get_changes(), or
+        # None when changes are not tracked, and whether swaps was cleared
+        self.changed = None
+        self.cleared = False
+
+    def __len__(self):
+        return self.drawn
+
+    def draw(self, rand, size):
+        """
+        Draws the next element of a permutation of range(size). The size may
+        grow between draws, which appends the new elements to the undrawn
+        ones.
+        @params
+            rand: the random.Random instance or random module to draw with
+            size: the current number of elements, more than drawn
+        @returns an element not drawn before, uniformly at random
+        """
+        k = self.drawn
+        j = rand.randrange(k, size)
+        swaps = self.swaps
+        element = swaps.get(j, j)
+        # Move the element at position k to the drawn element's position,
+        # after which position k is never looked at again
+        first = swaps.pop(k, k)
+        if j != k:
+            swaps[j] = first
+        self.drawn = k + 1
+        if self.changed is not None:
+            self.changed.add(k)
+            self.changed.add(j)
+        return element
+
+    def reset(self):
+        self.drawn = 0
+        self.swaps = {}
+        if self.changed is not None:
+            self.changed = set()
+            self.cleared = True
+
+    def get_state(self):
+        return (self.drawn, dict(self.swaps))
+
+    def set_state(self, state):
+        self.drawn, swaps = state
+        self.swaps = dict(swaps)
+
+    def track_changes(self, track=True):
+        """
+        Starts remembering the positions changed by draws, or stops if track
+        is False.
+        """
+        self.changed = set() if track else None
+        self.cleared = False
+
+    def get_changes(self):
+        """
+        @returns a tuple (drawn, cleared, changes) of the number of elements
+                 drawn, whether the permutation was reset, and a dict from
+                 every position changed since the last call, or since
+                 track_changes(), to its element in swaps or None if it has
+                 none, to be passed to apply_changes()
+        """
+        swaps = self.swaps
+        changes = { position : swaps.get(position)
+                    for position in self.changed }
+        cleared = self.cleared
+        self.changed = set()
+        self.cleared = False
+        return self.drawn, cleared, changes
+
+    def apply_changes(self, changes):
+        """
+        Brings the permutation from its state at one get_changes() call to
+        its state at the next one.
+        """
+        self.drawn, cleared, changes = changes
+        if cleared:
+            self.swaps = {}
+        swaps = self.swaps
+        for position, element in changes.items():
+            if element is None:
+                swaps.pop(position, None)
+            else:
+                swaps[position] = element
+
+# Test cases
+if __name__ == '__main__':
+    import random
+    permutation = LazyPermutation()
+    print(sorted(permutation.draw(random, 10) for i in range(10)))
+    print(len(permutation), permutation.swaps)
+    # Replaying the changes rebuilds the same permutation
+    permutation = LazyPermutation()
+    permutation.track_changes()
+    replayed = LazyPermutation()
+    for i in range(5):
+        for j in range(i * 3):
+            permutation.draw(random, 50)
+        if i == 3:
+            permutation.reset()
+        replayed.apply_changes(permutation.get_changes())
+    print(replayed.get_state() == permutation.get_state())
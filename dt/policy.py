@@ -0,0 +1,357 @@
+import random
+import math
+import numpy as np
+from .group_scorer import *
+from .score_cache import *
+from .utils import *
+
+"""
+Source selection policies for DT.run. A policy is a stateful object which is
+bound to a DT instance by start() at the beginning of every run, so anything
+that does not change during the run (probability estimators, costs, lookup
+tables) is resolved once instead of on every draw. Policies are registered by
+name; new ones can be added with register_policy() without editing DT.
+"""
+
+class Policy:
+    def start(self, dt):
+        """
+        Binds the policy to a DT instance at the start of a run, after the
+        sample counts of its data sources were reset.
+        """
+        self.dt = dt
+        self.data_sources = dt.data_sources
+
+    def select(self, iteration):
+        """
+        @returns the data source to sample from at the specified iteration
+        """
+        raise NotImplementedError
+
+    def select_batch(self, iteration, max_batch):
+        """
+        Selects sources for up to max_batch upcoming draws at once, where the
+        choices are known not to depend on the outcomes of those draws. A
+        batch must never exceed the total remaining query, so that batching
+        never overshoots the iteration at which the query becomes satisfied.
+        @returns a list of (data source, number of draws) pairs
+        """
+        return [(self.select(iteration), 1)]
+
+    def update(self, data_source, group):
+        """
+        Called whenever a new unique point of the group was collected from the
+        data source.
+        """
+        pass
+
+    def drawn(self, data_source, k):
+        """
+        Called after k draws from a data source without replacement, once
+        their new points were collected. Unlike update(), it is also called
+        when every drawn point was a duplicate.
+        """
+        pass
+
+    def arrived(self, data_source):
+        """
+        Called by DT.run_async when a draw from the data source arrives,
+        before its point is collected. Draws in DT.run always arrive before
+        the next select().
+        """
+        pass
+
+    def total_remaining(self):
+        return self.dt.collected_stats.remaining
+
+class RandomPolicy(Policy):
+    def select(self, iteration):
+        return random.choice(self.data_sources)
+
+    def select_batch(self, iteration, max_batch):
+        # Each draw picks a source independently and uniformly
+        limit = min(max_batch, self.total_remaining())
+        counts = [0] * len(self.data_sources)
+        for i in random.choices(range(len(self.data_sources)), k=limit):
+            counts[i] += 1
+        return [ (self.data_sources[i], counts[i])
+                 for i in range(len(self.data_sources)) if counts[i] > 0 ]
+
+class CoupColl(Policy):
+    """
+    Samples from the most cost-effective source for the unsatisfied group
+    with the highest group score.
+    """
+    weighted = False
+
+    def __init__(self, dupe=False):
+        self.dupe = dupe
+        if dupe:
+            self.prob_method = "gt-dupe"
+        else:
+            self.prob_method = "gt-nodupe"
+
+    def start(self, dt):
+        super().start(dt)
+        self.scorer = GroupScorer(dt, prob_method=self.prob_method,
+                                  weighted=self.weighted,
+                                  frontier=dt.frontier)
+
+    def select(self, iteration):
+        return self.scorer.select()
+
+    def select_batch(self, iteration, max_batch):
+        if self.dupe:
+            return [(self.select(iteration), 1)]
+        limit = min(max_batch, self.total_remaining())
+        return [self.scorer.select_batch(limit)]
+
+    def update(self, data_source, group):
+        self.scorer.update(data_source, group)
+
+    def drawn(self, data_source, k):
+        self.scorer.drawn(data_source)
+
+class RatioColl(CoupColl):
+    """
+    Like CoupColl, but weighs each group score by the group's remaining query.
+    """
+    weighted = True
+
+class BoundPolicy(Policy):
+    """
+    Base class for policies which compute group scores from a probability
+    estimator. Scores come from a ScoreCache, and since only the sources
+    drawn from can change their estimates, only those are checked when the
+    cache is refreshed. Subclasses implement choose() instead of select().
+    """
+    prob_method = "gt-nodupe"
+    prior_weight = 20.0
+
+    def start(self, dt):
+        super().start(dt)
+        self.source_index = { ds : i for i, ds in enumerate(self.data_sources) }
+        self.cache = ScoreCache(self.data_sources, dt.num_groups,
+                                self.prob_method, self.prior_weight,
+                                frontier=dt.frontier)
+        self.cache.refresh()
+        # Indices of the sources drawn from since the last refresh
+        self.touched = set()
+
+    def refresh(self):
+        """
+        @returns the ScoreCache, refreshed
+        """
+        self.cache.refresh(self.touched)
+        self.touched = set()
+        return self.cache
+
+    def select(self, iteration):
+        data_source = self.choose(iteration)
+        self.touched.add(self.source_index[data_source])
+        return data_source
+
+    def arrived(self, data_source):
+        self.touched.add(self.source_index[data_source])
+
+    def choose(self, iteration):
+        """
+        @returns the data source to sample from at the specified iteration
+        """
+        raise NotImplementedError
+
+class EpsilonGreedy(BoundPolicy):
+    """
+    Explores a random source with probability (log(t) / t)^(1/3) at iteration
+    t, otherwise exploits RatioColl over estimated probabilities.
+    """
+    def __init__(self, bayes=False, dupe=False):
+        if bayes:
+            self.prob_method = "bayes-dupe" if dupe else "bayes-nodupe"
+        else:
+            self.prob_method = "sample-dupe" if dupe else "sample-nodupe"
+
+    def choose(self, iteration):
+        r = random.random()
+        if (iteration < len(self.data_sources)):
+            return self.data_sources[iteration]
+        elif (r <= math.pow(math.log(iteration) / iteration, 1/3)): # Explore
+            return random.choice(self.data_sources)
+        else: # Exploit
+            dt = self.dt
+            cache = self.refresh()
+            group_scores = { g : dt.remaining_query(g) * cache.group_score(g)
+                             for g in dt.unsatisfied_groups() }
+            chosen_group = argmax(group_scores)
+            return cache.group_maximizing_source(chosen_group)
+
+class DualColl(BoundPolicy):
+    """
+    Samples from the source maximizing the expected reduction of the
+    remaining RatioColl group scores. With sparse sources, only unsatisfied
+    groups are summed over, since satisfied ones have no remaining query.
+    """
+    def choose(self, iteration):
+        dt = self.dt
+        cache = self.refresh()
+        if any(cache.sparse):
+            groups = dt.unsatisfied_groups()
+            group_scores = [ dt.remaining_query(g) * cache.group_score(g)
+                             for g in groups ]
+            ds_scores = { i : sum([ row[g] * score for g, score
+                                    in zip(groups, group_scores) ])
+                          for i, row in enumerate(cache.probabilities) }
+            return self.data_sources[argmax(ds_scores)]
+        group_scores = [ dt.remaining_query(g) * cache.group_score(g)
+                         for g in range(dt.num_groups) ]
+        ds_scores = { i : sum([ cache.probabilities[i][g] * group_scores[g]
+                                for g in range(dt.num_groups) ])
+                      for i in range(len(self.data_sources)) }
+        return self.data_sources[argmax(ds_scores)]
+
+class UCB(Policy):
+    """
+    Upper confidence bound over per-source rewards, where a source's reward
+    grows with how often it yields unsatisfied groups, each weighted by how
+    rare the group is overall. Per-source sample counts are kept in NumPy
+    arrays; only the row of the previously selected source is refreshed each
+    iteration, and all upper bounds are computed in one vector expression.
+    With sparse sources, scores are instead summed over the groups a source
+    was sampled from, and adjusted group by group as groups get satisfied.
+    """
+    def start(self, dt):
+        super().start(dt)
+        self.sparse = any(ds.sparse for ds in self.data_sources)
+        # Memoize total counts for each group
+        total_group_counts = [0] * dt.num_groups
+        total_count = 0
+        if self.sparse:
+            for ds in self.data_sources:
+                if ds.synthetic:
+                    counts = enumerate(ds.probs)
+                else:
+                    counts = ds.gt_stats.items()
+                for g, count in counts:
+                    total_group_counts[g] += count
+                    total_count += count
+        else:
+            for g in range(dt.num_groups):
+                for ds in self.data_sources:
+                    if ds.synthetic: # Synthetic DS doesn't have a "count"
+                        count = ds.probability(g)
+                    else:
+                        count = ds.count(g)
+                    total_group_counts[g] += count
+                    total_count += count
+        # Groups no source holds, common among intersectional groups, yield
+        # no reward
+        self.ucb_rewards = [ total_count / total_group_counts[j]
+                             if total_group_counts[j] else float('inf')
+                             for j in range(dt.num_groups) ]
+        n = len(self.data_sources)
+        self.source_index = { ds : i for i, ds in enumerate(self.data_sources) }
+        self.costs = np.array([ ds.cost for ds in self.data_sources ])
+        if self.sparse:
+            self.counts = None
+        else:
+            self.counts = np.zeros((n, dt.num_groups))
+        self.totals = np.zeros(n)
+        # Reward weight of each group, zeroed once the group is satisfied
+        self.weights = 1.0 / np.array(self.ucb_rewards)
+        for g in range(dt.num_groups):
+            if dt.remaining_query(g) == 0:
+                self.weights[g] = 0.0
+        self.scores = np.zeros(n)
+        self.last = None
+        # Sources may already have been sampled when resuming a run
+        for i in range(n):
+            self.refresh(i)
+
+    def refresh(self, i):
+        """
+        Reloads the sample counts of source i and recomputes its score.
+        """
+        stats = self.data_sources[i].sample_stats
+        self.totals[i] = len(stats)
+        if self.sparse:
+            weights = self.weights
+            self.scores[i] = sum([ count * weights[g]
+                                   for g, count in stats.items() ])
+            return
+        self.counts[i] = stats.array
+        self.scores[i] = self.counts[i] @ self.weights
+
+    def arrived(self, data_source):
+        # With draws in flight, the source of an arriving draw need not be the
+        # one selected last
+        self.refresh(self.source_index[data_source])
+
+    def update(self, data_source, group):
+        if self.dt.remaining_query(group) == 0 and self.weights[group] != 0.0:
+            if self.last is not None:
+                self.refresh(self.last)
+            if self.sparse:
+                weight = self.weights[group]
+                for i, ds in enumerate(self.data_sources):
+                    self.scores[i] -= ds.sample_stats[group] * weight
+                self.weights[group] = 0.0
+                return
+            self.weights[group] = 0.0
+            self.scores = self.counts @ self.weights
+
+    def select(self, iteration):
+        if self.last is not None:
+            self.refresh(self.last)
+        # Initialization rounds
+        if iteration < len(self.data_sources):
+            self.last = iteration
+            return self.data_sources[iteration]
+        # Sources none of whose draws arrived yet, which only happens with
+        # draws in flight in DT.run_async, have an unbounded upper bound
+        if not self.totals.all():
+            unsampled = np.flatnonzero(self.totals == 0)
+            self.last = random.choice(unsampled.tolist())
+            return self.data_sources[self.last]
+        # Estimated reward from each data source
+        avg_rewards = (1.0 + self.scores) / (self.totals * self.costs)
+        # UCB logic
+        rewards_range = avg_rewards.max() - avg_rewards.min()
+        upper_bounds = avg_rewards + rewards_range * np.sqrt(
+            2 * math.log(iteration) / self.totals)
+        tied = np.flatnonzero(upper_bounds >= upper_bounds.max())
+        self.last = random.choice(tied.tolist())
+        return self.data_sources[self.last]
+
+# Registry of policy factories by name
+POLICIES = {
+    "random": RandomPolicy,
+    "coupcoll-nodupe": lambda: CoupColl(dupe=False),
+    "coupcoll-dupe": lambda: CoupColl(dupe=True),
+    "ratiocoll-nodupe": lambda: RatioColl(dupe=False),
+    "ratiocoll-dupe": lambda: RatioColl(dupe=True),
+    "epsilon-exact-nodupe": lambda: EpsilonGreedy(bayes=False, dupe=False),
+    "epsilon-exact-dupe": lambda: EpsilonGreedy(bayes=False, dupe=True),
+    "epsilon-bayes-nodupe": lambda: EpsilonGreedy(bayes=True, dupe=False),
+    "epsilon-bayes-dupe": lambda: EpsilonGreedy(bayes=True, dupe=True),
+    "dualcoll": DualColl,
+    "ucb": UCB,
+}
+
+def register_policy(name, factory):
+    """
+    @params
+        name: the name by which DT.run will accept the policy
+        factory: a function with no arguments returning a fresh Policy
+    """
+    POLICIES[name] = factory
+
+def create_policy(policy):
+    """
+    @returns a fresh Policy for a registered name, or the policy itself if it
+             is already a Policy instance
+    """
+    if isinstance(policy, Policy):
+        return policy
+    if policy not in POLICIES:
+        raise ValueError("Unknown policy: " + str(policy))
+    return POLICIES[policy]()
@@ -1,36 +1,62 @@
 import random
+import numpy as np
 from .stat_tracker import *
 from .data_point import *
+from .permutation import *
 
 """
 Represents a real-world data source containing instances of DataPoint. 
+Records are sampled with replacement by default. Without replacement, every
+run draws the records in the order of a LazyPermutation, so no draw is a
+duplicate of an earlier one until every record was drawn, and "gt-dupe"
+becomes the exact probability of each group among the records not drawn yet.
 """
 
 class RealSource:
-    def __init__(self, num_groups, cost):
+    # An optional random.Random instance used for sampling instead of the
+    # global random module, see set_stream()
+    stream = None
+
+    def __init__(self, num_groups, cost, sparse=False, replace=True):
         """
         @params
             num_groups: the number of groups that data points may belong to
             cost: cost of sampling from this data source
+            sparse: if True, counts are kept in SparseStatTracker instances,
+                    for sources holding few of a large number of groups
+            replace: if False, records are sampled without replacement,
+                     starting over once every record was drawn
         """
         self.num_groups = num_groups
         self.cost = float(cost)
         self.data_points = []
+        self.sparse = sparse
         # The stat tracker which knows the ground truth of all groups
-        self.gt_stats = StatTracker(num_groups)
+        self.gt_stats = self.new_stats()
         # The stat tracker which is ticked whenever the sample method is called
-        self.sample_stats = StatTracker(num_groups)
+        self.sample_stats = self.new_stats()
         # Unlike sample_stats, this one keeps track of the non-duplicate
         # data points which were sampled
-        self.unique_sample_stats = StatTracker(num_groups)
+        self.unique_sample_stats = self.new_stats()
         self.synthetic = False
+        self.replace = replace
+        # Order in which records are drawn without replacement in this run
+        self.permutation = LazyPermutation()
     
     def __len__(self):
         return len(self.data_points)
     
     def __getitem__(self, position):
-        return self.data_sources[position]
+        return self.data_points[position]
     
+    def new_stats(self, initial_count=0):
+        """
+        @returns a stat tracker of the kind this source keeps its counts in
+        """
+        if self.sparse:
+            return SparseStatTracker(self.num_groups, initial_count)
+        return StatTracker(self.num_groups, initial_count)
+
     def __str__(self):
         s = "{Cost: " + str(self.cost) + ", Length: " + str(len(self))
         s += ", Stats: " + str(self.gt_stats) + ")"
@@ -51,6 +77,8 @@ class RealSource:
         dupes = self.unique_sample_stats[group]
         if method == "gt-nodupe":
             return self.gt_stats.prob(group)
+        elif method == "gt-dupe" and not self.replace:
+            return self.undrawn_prob(group)
         elif method == "gt-dupe":
             return self.gt_stats.prob(group, dupes=dupes)
         elif method == "sample-nodupe":
@@ -64,6 +92,131 @@ class RealSource:
         else:
             return self.gt_stats.prob(group)
     
+    def probability_function(self, method="gt", prior_weight=20):
+        """
+        Resolves the probability method once, for callers which compute many
+        probabilities with the same method and prior weight. 
+        @returns a function from group to probability(group, method,
+                 prior_weight)
+        """
+        if method == "gt-dupe" and not self.replace:
+            return self.undrawn_prob
+        elif method == "gt-dupe":
+            return lambda group: self.gt_stats.prob(group,
+                dupes=self.unique_sample_stats[group])
+        elif method == "sample-nodupe":
+            return lambda group: self.sample_stats.prob(group)
+        elif method == "sample-dupe":
+            return lambda group: self.sample_stats.prob(group,
+                dupes=self.unique_sample_stats[group])
+        elif method == "bayes-nodupe":
+            return lambda group: self.sample_stats.bayes_prob(group,
+                prior_weight)
+        elif method == "bayes-dupe":
+            return lambda group: self.sample_stats.bayes_prob(group,
+                prior_weight, dupes=self.unique_sample_stats[group])
+        else:
+            return lambda group: self.gt_stats.prob(group)
+
+    def probabilities_function(self, method="gt", prior_weight=20):
+        """
+        Like probability_function(), but for all groups at once.
+        @returns a function with no arguments returning the array of
+                 probability(group, method, prior_weight) for every group
+        """
+        if method == "gt-dupe" and not self.replace:
+            return self.undrawn_probs
+        elif method == "gt-dupe":
+            return lambda: self.gt_stats.probs(
+                dupes=self.unique_sample_stats.array)
+        elif method == "sample-nodupe":
+            return lambda: self.sample_stats.probs()
+        elif method == "sample-dupe":
+            return lambda: self.sample_stats.probs(
+                dupes=self.unique_sample_stats.array)
+        elif method == "bayes-nodupe":
+            return lambda: self.sample_stats.bayes_probs(prior_weight)
+        elif method == "bayes-dupe":
+            return lambda: self.sample_stats.bayes_probs(prior_weight,
+                dupes=self.unique_sample_stats.array)
+        else:
+            return lambda: self.gt_stats.probs()
+
+    def sparse_probabilities_function(self, method="gt", prior_weight=20):
+        """
+        Like probabilities_function(), but in time linear in the number of
+        groups with a nonzero count in the stats the method depends on, every
+        other group sharing a single probability. Meant for sparse sources.
+        @returns a function with no arguments returning a tuple (default,
+                 probabilities), where probabilities maps every group with a
+                 nonzero count to probability(group, method, prior_weight),
+                 and default is the probability of every other group
+        """
+        probability = self.probability_function(method, prior_weight)
+        if method in ["sample-nodupe", "sample-dupe", "bayes-nodupe",
+                      "bayes-dupe"]:
+            stats = self.sample_stats
+        else:
+            stats = self.gt_stats
+        if not method.startswith("bayes"):
+            prior_weight = None
+        if method == "gt-dupe" and not self.replace:
+            return lambda: (self.undrawn_prob(None),
+                { g : probability(g) for g in stats.counts })
+        elif method in ["sample-dupe", "bayes-dupe"]:
+            # Unique counts are kept across runs, unlike sample counts
+            dupes = self.unique_sample_stats
+            return lambda: (stats.zero_prob(prior_weight),
+                { g : probability(g) for g in
+                  set(stats.counts).union(dupes.counts) })
+        return lambda: (stats.zero_prob(prior_weight),
+            { g : probability(g) for g in stats.counts })
+
+    def version_function(self, method="gt"):
+        """
+        @returns a function whose value changes whenever
+                 probability(group, method) may have changed for some group
+        """
+        if method == "gt-dupe" and not self.replace:
+            return lambda: (self.gt_stats, self.gt_stats.version,
+                self.sample_stats, self.sample_stats.version)
+        elif method == "gt-dupe":
+            return lambda: (self.gt_stats, self.gt_stats.version,
+                self.unique_sample_stats, self.unique_sample_stats.version)
+        elif method in ["sample-nodupe", "bayes-nodupe"]:
+            return lambda: (self.sample_stats, self.sample_stats.version)
+        elif method in ["sample-dupe", "bayes-dupe"]:
+            return lambda: (self.sample_stats, self.sample_stats.version,
+                self.unique_sample_stats, self.unique_sample_stats.version)
+        else:
+            return lambda: (self.gt_stats, self.gt_stats.version)
+
+    def undrawn_prob(self, group):
+        """
+        @returns the probability that the next draw without replacement is of
+                 the group, 0 once every record was drawn, or -1 for an empty
+                 source; group may be None for a group with no record
+        """
+        if self.gt_stats.total_count == 0:
+            return -1
+        undrawn = self.gt_stats.total_count - self.sample_stats.total_count
+        if undrawn <= 0:
+            return 0.0
+        if group is None:
+            return 0 / undrawn
+        return (self.gt_stats[group] - self.sample_stats[group]) / undrawn
+
+    def undrawn_probs(self):
+        """
+        @returns the array of undrawn_prob(group) for every group
+        """
+        if self.gt_stats.total_count == 0:
+            return np.full(self.num_groups, -1.0)
+        undrawn = self.gt_stats.total_count - self.sample_stats.total_count
+        if undrawn <= 0:
+            return np.zeros(self.num_groups)
+        return (self.gt_stats.array - self.sample_stats.array) / undrawn
+
     def count(self, group):
         return self.gt_stats[group]
 
@@ -83,16 +236,95 @@ class RealSource:
         for data_point in data_points:
             self.add_point(data_point)
 
+    def draw_position(self, rand):
+        """
+        @returns the position of the next record drawn without replacement,
+                 starting a new permutation once every record was drawn
+        """
+        if len(self.permutation) >= len(self):
+            self.permutation.reset()
+        return self.permutation.draw(rand, len(self))
+
     def sample(self):
         """
         @returns a uniformly random data point and updates sample_stats
         """
-        data_point = random.choice(self.data_points)
+        rand = self.stream or random
+        if not self.replace:
+            data_point = self.data_points[self.draw_position(rand)]
+        else:
+            data_point = rand.choice(self.data_points)
         self.sample_stats.add_point(data_point.group)
         return data_point
 
+    def sample_batch(self, k):
+        """
+        @returns a list of k uniformly random data points, drawn with
+                 replacement unless the source was created with
+                 replace=False, and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            data_points = [ self.data_points[self.draw_position(rand)]
+                            for _ in range(k) ]
+        else:
+            data_points = rand.choices(self.data_points, k=k)
+        self.sample_stats.add_points([ point.group for point in data_points ])
+        return data_points
+
+    def sample_position(self):
+        """
+        Samples like sample(), but identifies the data point by its position.
+        @returns a tuple (position, group) and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            position = self.draw_position(rand)
+        else:
+            position = rand.randrange(len(self.data_points))
+        group = self.data_points[position].group
+        self.sample_stats.add_point(group)
+        return position, group
+
+    def sample_position_batch(self, k):
+        """
+        @returns a list of k (position, group) tuples, drawn with
+                 replacement unless the source was created with
+                 replace=False, and updates sample_stats
+        """
+        rand = self.stream or random
+        if not self.replace:
+            positions = [ self.draw_position(rand) for _ in range(k) ]
+        else:
+            positions = rand.choices(range(len(self.data_points)), k=k)
+        groups = [ self.data_points[position].group for position in positions ]
+        self.sample_stats.add_points(groups)
+        return list(zip(positions, groups))
+
+    def set_stream(self, seed):
+        """
+        Gives this source its own random stream, so that its k-th draw is the
+        same no matter how draws from other sources are interleaved.
+        """
+        self.stream = random.Random(seed)
+
+    def get_random_state(self):
+        """
+        @returns the state of this source's own random stream, if any. The
+                 permutation of a source sampling without replacement grows
+                 with every draw, so DT.run_checkpointed() saves its changes
+                 instead, see LazyPermutation.get_changes()
+        """
+        return None if self.stream is None else self.stream.getstate()
+
+    def set_random_state(self, state):
+        if state is not None:
+            self.stream = random.Random()
+            self.stream.setstate(state)
+
     def reset_sample(self):
-        self.sample_stats = StatTracker(self.num_groups)
+        self.sample_stats.reset()
+        self.permutation.reset()
 
 # Test cases
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+import json
+import sqlite3
+import time
+
+"""
+An append-only SQLite store of experiment cell results, keyed by
+(experiment, parameters, policy, rep, seed). Experiment grids add each cell
+as soon as it finishes, so a crashed sweep can be rerun and only runs the
+cells missing from the store, and averages over reps are computed by SQLite
+instead of by re-parsing text logs. Parameters are stored as the JSON list
+of a config's values.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    experiment TEXT NOT NULL,
+    params TEXT NOT NULL,
+    policy TEXT NOT NULL,
+    rep INTEGER NOT NULL,
+    seed TEXT NOT NULL,
+    cost REAL NOT NULL,
+    iterations INTEGER NOT NULL,
+    seconds REAL,
+    finished TEXT NOT NULL,
+    PRIMARY KEY (experiment, params, policy, rep, seed)
+)
+"""
+
+def encode_params(config):
+    """
+    @returns the text a config is stored as
+    """
+    return json.dumps(list(config))
+
+def decode_params(params):
+    return tuple(json.loads(params))
+
+class ResultsStore:
+    def __init__(self, path):
+        """
+        @params
+            path: the SQLite database file, created if it does not exist
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # Readers need not wait for the writer, and a crash never leaves a
+        # half-written cell
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def add(self, experiment, config, policy, rep, seed, cost, iterations,
+            seconds=None):
+        """
+        Records the result of a cell, unless the store already holds it.
+        """
+        self.connection.execute(
+            "INSERT OR IGNORE INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (experiment, encode_params(config), policy, rep, str(seed),
+             float(cost), int(iterations), seconds,
+             time.strftime("%Y-%m-%dT%H:%M:%S")))
+        self.connection.commit()
+
+    def results(self, experiment):
+        """
+        @returns a dict from the (config, policy, rep, seed) key of every cell
+                 of the experiment to its (cost, iterations)
+        """
+        rows = self.connection.execute(
+            "SELECT params, policy, rep, seed, cost, iterations FROM cells "
+            "WHERE experiment = ?", (experiment,))
+        return { (decode_params(params), policy, rep, int(seed)) :
+                 (cost, iterations)
+                 for params, policy, rep, seed, cost, iterations in rows }
+
+    def averages(self, experiment, policy=None):
+        """
+        @returns a list of (config, policy, reps, avg_cost, avg_iters) tuples,
+                 one per (config, policy) pair of the experiment, optionally
+                 only for the policy, in the order the pairs were first added
+        """
+        query = ("SELECT params, policy, COUNT(*), AVG(cost), AVG(iterations) "
+                 "FROM cells WHERE experiment = ?")
+        args = [experiment]
+        if policy is not None:
+            query += " AND policy = ?"
+            args.append(policy)
+        query += " GROUP BY params, policy ORDER BY MIN(rowid)"
+        return [ (decode_params(params), policy, reps, avg_cost, avg_iters)
+                 for params, policy, reps, avg_cost, avg_iters
+                 in self.connection.execute(query, args) ]
+
+    def experiments(self):
+        """
+        @returns the list of experiments with results in the store
+        """
+        return [ row[0] for row in self.connection.execute(
+            "SELECT DISTINCT experiment FROM cells ORDER BY experiment") ]
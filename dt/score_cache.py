@@ -0,0 +1,166 @@
+import random
+import numpy as np
+from .source_frontier import *
+from .utils import *
+
+"""
+Caches the n x m table of C_i / P(G_j | D_i) for one probability method,
+together with the per-group scores derived from it. Every source reports a
+version of the stats its probabilities depend on; a source's row is only
+recomputed when its version moved, and the cached group scores are only
+dropped when some row changed. With a frontier size, the best sources of
+every group are looked up in SourceFrontier indexes instead of scanning all
+sources. Values and tie-breaking are identical to recomputing DT.group_score
+and DT.group_maximizing_source from scratch.
+
+The row of a sparse source is a SparseRow holding only the groups with a
+nonzero count in the source, every other group sharing the row's default, so
+computing it takes time in the number of those groups.
+"""
+
+class SparseRow(dict):
+    """
+    A row of the cache mapping groups to values, where missing groups have
+    the default value.
+    """
+    __slots__ = ("default",)
+
+    def __init__(self, default, values):
+        super().__init__(values)
+        self.default = default
+
+    def __missing__(self, group):
+        return self.default
+
+def group_cost(cost, probability):
+    if probability == 0.0:
+        return float('inf')
+    return cost / probability
+
+class ScoreCache:
+    def __init__(self, data_sources, num_groups, prob_method="gt-nodupe",
+                 prior_weight=20.0, frontier=None):
+        """
+        @params
+            data_sources: the data sources of the DT instance
+            num_groups: number of groups in the data sources
+            prob_method: the probability method passed to each data source
+            prior_weight: the weight of the Dirichlet prior for "bayes-*"
+            frontier: if given, the number of best sources kept per group in
+                      the SourceFrontier indexes
+        """
+        self.data_sources = data_sources
+        self.num_groups = num_groups
+        self.sparse = [ ds.sparse for ds in data_sources ]
+        self.probs = [
+            ds.sparse_probabilities_function(prob_method, prior_weight)
+            if ds.sparse else
+            ds.probabilities_function(prob_method, prior_weight)
+            for ds in data_sources ]
+        self.version_functions = [ ds.version_function(prob_method)
+                                   for ds in data_sources ]
+        self.versions = [None] * len(data_sources)
+        # probabilities[i][g] = P(G_g | D_i), costs[i][g] = C_i / P(G_g | D_i)
+        # and ratios[i][g] = P(G_g | D_i) / C_i
+        self.probabilities = [None] * len(data_sources)
+        self.costs = [None] * len(data_sources)
+        self.ratios = [None] * len(data_sources)
+        self.group_scores = {}
+        self.frontier = frontier
+        # Built by the first refresh computing every row
+        self.cost_frontier = None
+        self.ratio_frontier = None
+
+    def refresh(self, indices=None):
+        """
+        Recomputes the rows of the sources whose stats changed since the last
+        refresh.
+        @params
+            indices: if given, only these sources are checked, which must
+                     include every source whose stats may have changed
+        """
+        if indices is None:
+            indices = range(len(self.data_sources))
+        changed = []
+        for i in indices:
+            version = self.version_functions[i]()
+            if version != self.versions[i]:
+                changed.append((i, self.compute_row(i)))
+                self.versions[i] = version
+        if changed:
+            self.group_scores = {}
+            if self.frontier is not None:
+                self.update_frontiers(changed)
+
+    def update_frontiers(self, changed):
+        if self.cost_frontier is None:
+            if None in self.costs:
+                return
+            # The least cost is the highest negated cost
+            self.cost_frontier = SourceFrontier(len(self.data_sources),
+                self.num_groups, lambda g, i: -self.costs[i][g],
+                self.frontier)
+            self.ratio_frontier = SourceFrontier(len(self.data_sources),
+                self.num_groups, lambda g, i: self.ratios[i][g],
+                self.frontier)
+            return
+        for i, groups in changed:
+            if groups is None:
+                groups = range(self.num_groups)
+            for g in groups:
+                self.cost_frontier.update(g, i)
+                self.ratio_frontier.update(g, i)
+
+    def compute_row(self, i):
+        """
+        Recomputes the row of source i.
+        @returns the groups whose entries may have changed, or None if all
+                 of them may have
+        """
+        cost = self.data_sources[i].cost
+        if self.sparse[i]:
+            default, probabilities = self.probs[i]()
+            previous = self.probabilities[i]
+            self.probabilities[i] = SparseRow(default, probabilities)
+            self.costs[i] = SparseRow(group_cost(cost, default),
+                { g : group_cost(cost, p) for g, p in probabilities.items() })
+            self.ratios[i] = SparseRow(default / cost,
+                { g : p / cost for g, p in probabilities.items() })
+            if previous is None or previous.default != default:
+                return None
+            return set(previous).union(probabilities)
+        probabilities = self.probs[i]()
+        costs = np.full(self.num_groups, float('inf'))
+        nonzero = probabilities != 0.0
+        costs[nonzero] = cost / probabilities[nonzero]
+        # Rows are kept as lists, whose items are faster to look up one by one
+        self.probabilities[i] = probabilities.tolist()
+        self.costs[i] = costs.tolist()
+        self.ratios[i] = (probabilities / cost).tolist()
+        return None
+
+    def group_score(self, group):
+        """
+        @returns min_{forall D_i \in D}(C_i / P(G_j | D_i)) as of the last
+                 refresh
+        """
+        score = self.group_scores.get(group)
+        if score is None:
+            if self.cost_frontier is not None:
+                score = -self.cost_frontier.top(group)
+            else:
+                score = min([ row[group] for row in self.costs ])
+            self.group_scores[group] = score
+        return score
+
+    def group_maximizing_source(self, group):
+        """
+        @returns the data source which maximizes the expected cost of sampling
+                 the group as of the last refresh, ties broken randomly
+        """
+        if self.ratio_frontier is not None:
+            return self.data_sources[
+                random.choice(self.ratio_frontier.best(group)[1])]
+        expected_costs = { i : self.ratios[i][group]
+                           for i in range(len(self.data_sources)) }
+        return self.data_sources[argmax(expected_costs)]
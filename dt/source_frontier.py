@@ -0,0 +1,172 @@
+import heapq
+
+"""
+Keeps, for every group, only the few data sources with the best value of
+some per-(group, source) score, such as P(G_j | D_i) / C_i, so that finding
+the best sources for a group takes time in the size of this frontier instead
+of in the number of sources. The other sources of a group wait in a max-heap
+whose top bounds all of their scores, so the best frontier member is the
+best source overall once it scores at least the bound, and its ties are
+found by promoting the sources at the top of the heap. Once the best member
+falls below the bound, as happens on almost every draw when estimates drop
+with duplicates, the heap's top sources are promoted one at a time instead
+of rescanning all sources.
+"""
+
+class SourceFrontier:
+    def __init__(self, num_sources, num_groups, value, k=8):
+        """
+        @params
+            num_sources: number of data sources
+            num_groups: number of groups
+            value: a function from (group, source index) to the score to
+                   maximize, read again whenever a source is looked at
+            k: number of sources kept per group, not counting ties
+        """
+        self.num_sources = num_sources
+        self.num_groups = num_groups
+        self.value = value
+        self.k = k
+        # members[g] maps each source in the frontier of g to its score, and
+        # outside[g] is a heap of (-score, source) entries where every other
+        # source has an entry scoring at least its current score. Entries of
+        # members, and entries above a source's score, are stale.
+        self.members = [None] * num_groups
+        self.outside = [None] * num_groups
+        # Size beyond which a frontier is trimmed
+        self.limits = [None] * num_groups
+        for g in range(num_groups):
+            self.rebuild(g)
+
+    def rebuild(self, group):
+        """
+        Recomputes the frontier of a group from the scores of all sources.
+        """
+        values = [ self.value(group, i) for i in range(self.num_sources) ]
+        members, others = self.split(enumerate(values))
+        outside = [ (-v, i) for i, v in others ]
+        heapq.heapify(outside)
+        self.members[group] = members
+        self.outside[group] = outside
+        self.limits[group] = max(4 * self.k, 2 * len(members))
+
+    def split(self, items):
+        """
+        Splits (source, score) pairs into the frontier of the k best scores,
+        ties broken by order, and the others.
+        @returns the dict of the members' scores and the list of the other
+                 (source, score) pairs
+        """
+        items = list(items)
+        kth = heapq.nlargest(self.k, [ v for i, v in items ])[-1]
+        # Number of sources scoring kth which still fit in the frontier
+        room = self.k - sum([ 1 for i, v in items if v > kth ])
+        members = {}
+        others = []
+        for i, v in items:
+            if v > kth:
+                members[i] = v
+            elif v == kth and room > 0:
+                members[i] = v
+                room -= 1
+            else:
+                others.append((i, v))
+        return members, others
+
+    def bound(self, group):
+        """
+        @returns an upper bound of the scores of the sources outside the
+                 frontier of the group
+        """
+        outside = self.outside[group]
+        if outside:
+            return -outside[0][0]
+        return float('-inf')
+
+    def update(self, group, i):
+        """
+        Records a change of the score of source i for the group.
+        """
+        v = self.value(group, i)
+        members = self.members[group]
+        if i in members or v > self.bound(group):
+            members[i] = v
+        else:
+            outside = self.outside[group]
+            heapq.heappush(outside, (-v, i))
+            # Drop stale entries once they outnumber the sources
+            if len(outside) > 2 * self.num_sources + 64:
+                self.rebuild(group)
+
+    def promote(self, group):
+        """
+        Moves the best source outside the frontier of the group into it.
+        @returns its score, or None if the top entry of the heap was stale
+        """
+        v, i = heapq.heappop(self.outside[group])
+        members = self.members[group]
+        if i in members:
+            return None
+        current = self.value(group, i)
+        if current < -v:
+            # The source's score dropped since the entry was pushed, while
+            # every rise got its own entry from update()
+            heapq.heappush(self.outside[group], (-current, i))
+            return None
+        members[i] = current
+        return current
+
+    def trim(self, group):
+        """
+        Moves the members of the frontier of the group below its k best
+        scores back to the heap, except those tied for the best score.
+        """
+        members, others = self.split(self.members[group].items())
+        top = max(members.values())
+        outside = self.outside[group]
+        for i, v in others:
+            if v >= top:
+                members[i] = v
+            else:
+                heapq.heappush(outside, (-v, i))
+        self.members[group] = members
+        self.limits[group] = max(4 * self.k, 2 * len(members))
+
+    def top(self, group):
+        """
+        @returns the highest score for the group
+        """
+        members = self.members[group]
+        top = max(members.values())
+        # Promote outside sources while one may beat the best member
+        outside = self.outside[group]
+        while outside and top < -outside[0][0]:
+            v = self.promote(group)
+            if v is not None and v > top:
+                top = v
+        if len(members) > self.limits[group]:
+            self.trim(group)
+        return top
+
+    def best(self, group):
+        """
+        @returns the highest score for the group, and the indices of the
+                 sources with that score in increasing order
+        """
+        top = self.top(group)
+        # Promote the outside sources which may tie the best member
+        outside = self.outside[group]
+        while outside and top <= -outside[0][0]:
+            self.promote(group)
+        members = self.members[group]
+        return top, sorted([ i for i, v in members.items() if v >= top ])
+
+    def sources(self):
+        """
+        @returns the indices of the sources in the frontier of some group,
+                 outside of which no source is currently best for any group
+        """
+        frontier = set()
+        for members in self.members:
+            frontier.update(members)
+        return sorted(frontier)
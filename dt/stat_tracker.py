@@ -1,31 +1,56 @@
+import array
+import numpy as np
+
 """
 A counter which keeps track of the number of data points that belong to each
-group, either as ground truth or from sampling. 
+group, either as ground truth or from sampling. Counts live in a compact int64
+array, which is also exposed as a NumPy view so that the probabilities of all
+groups can be computed at once. SparseStatTracker holds only the nonzero
+counts instead, for large numbers of groups.
 """
 
 class StatTracker:
+    __slots__ = ("num_groups", "version", "counts", "array", "total_count",
+                 "prior_weight", "prior_a", "prior_b")
+
     def __init__(self, num_groups, initial_count=0):
         """
         @params
             num_groups: number of groups that data points may belong to
             initial_count: 
                 if int: each group is initialized with the integer count
-                if list: this list replaces the default count tracker
+                otherwise: a sequence of the initial count of every group
         """
         self.num_groups = num_groups
+        # Bumped on every change of the counts, so that cached values derived
+        # from them can tell when they are stale
+        self.version = 0
         # Switch based on count initialization
         if type(initial_count) == int:
-            self.counts = [initial_count] * num_groups
-            self.total_count = initial_count * num_groups
-        elif type(initial_count) == list:
-            self.counts = initial_count
-            self.total_count = sum(initial_count)
+            self.counts = array.array("q", [initial_count]) * num_groups
+        else:
+            self.counts = array.array("q", initial_count)
+        # Shares memory with counts, which must therefore never be resized
+        self.array = np.frombuffer(self.counts, dtype=np.int64)
+        self.total_count = int(self.array.sum())
+        # Dirichlet prior constants of the last prior weight used
+        self.prior_weight = None
+        self.prior_a = 0.0
+        self.prior_b = 0.0
+
+    def __getstate__(self):
+        return (self.num_groups, self.version, self.counts.tolist())
+
+    def __setstate__(self, state):
+        num_groups, version, counts = state
+        self.__init__(num_groups, initial_count=counts)
+        self.version = version
     
     def __getitem__(self, group):
         return self.counts[group]
     
     def __str__(self):
-        return str(self.counts)
+        return str(self.counts.tolist())
     
     def __repr__(self):
         return str(self)
@@ -39,10 +64,61 @@ class StatTracker:
         """
         self.counts[group] += 1
         self.total_count += 1
+        self.version += 1
     
+    def add_points(self, groups):
+        """
+        Increments the counter once for each group in an iterable of groups.
+        """
+        counts = self.counts
+        for group in groups:
+            counts[group] += 1
+        self.total_count += len(groups)
+        self.version += 1
+
     def decrement_point(self, group):
         self.counts[group] -= 1
         self.total_count -= 1
+        self.version += 1
+
+    def reset(self):
+        """
+        Zeroes every count in place.
+        """
+        self.array[:] = 0
+        self.total_count = 0
+        self.version += 1
+
+    def set_counts(self, counts):
+        """
+        Overwrites every count in place.
+        """
+        self.array[:] = counts
+        self.total_count = int(self.array.sum())
+        self.version += 1
+
+    def snapshot(self):
+        """
+        @returns a compact copy of the counts, which set_counts() accepts
+        """
+        return array.array("q", self.counts)
+
+    def items(self):
+        """
+        @returns a list of (group, count) tuples of the groups with a nonzero
+                 count, in increasing order of group
+        """
+        groups = np.flatnonzero(self.array)
+        return list(zip(groups.tolist(), self.array[groups].tolist()))
+
+    def set_prior(self, prior_weight):
+        """
+        Precomputes the constants of a uniform Dirichlet prior with the
+        specified weight.
+        """
+        self.prior_weight = prior_weight
+        self.prior_a = prior_weight / (self.num_groups + 1)
+        self.prior_b = self.num_groups * prior_weight / (self.num_groups + 1)
     
     def prob(self, group, dupes=0):
         """
@@ -62,10 +138,34 @@ class StatTracker:
         if self.total_count == 0:
             return -1
         else:
-            a = prior_weight / (self.num_groups + 1)
-            b = self.num_groups * prior_weight / (self.num_groups + 1)
+            if prior_weight != self.prior_weight:
+                self.set_prior(prior_weight)
             net_count = self.counts[group] - dupes
-            return (net_count + a) / (self.total_count + b)
+            return (net_count + self.prior_a) / (self.total_count + self.prior_b)
+
+    def probs(self, dupes=None):
+        """
+        @params
+            dupes: an optional array of counts subtracted from every group
+        @returns an array of prob(group) for every group
+        """
+        if self.total_count == 0:
+            return np.full(self.num_groups, -1.0)
+        net_counts = self.array if dupes is None else self.array - dupes
+        return net_counts / self.total_count
+
+    def bayes_probs(self, prior_weight, dupes=None):
+        """
+        @params
+            dupes: an optional array of counts subtracted from every group
+        @returns an array of bayes_prob(group, prior_weight) for every group
+        """
+        if self.total_count == 0:
+            return np.full(self.num_groups, -1.0)
+        if prior_weight != self.prior_weight:
+            self.set_prior(prior_weight)
+        net_counts = self.array if dupes is None else self.array - dupes
+        return (net_counts + self.prior_a) / (self.total_count + self.prior_b)
 
     def is_satisfied_by(self, other):
         """
@@ -77,6 +177,305 @@ class StatTracker:
                 return False
         return True
 
+class SparseStatTracker(StatTracker):
+    """
+    A count tracker holding only the nonzero counts, in a dictionary from
+    group to count, so that its size and the time to reset it grow with the
+    number of groups seen rather than with the number of groups. Meant for
+    intersectional groups with tens of thousands of mostly empty groups.
+    Dense views, such as array and probs(), are built on demand in time
+    linear in the number of groups.
+    """
+    __slots__ = ()
+
+    def __init__(self, num_groups, initial_count=0):
+        """
+        @params
+            num_groups: number of groups that data points may belong to
+            initial_count:
+                if int: each group is initialized with the integer count
+                if a mapping: the initial count of each group it holds, zero
+                              for every other group
+                otherwise: a sequence of the initial count of every group
+        """
+        self.num_groups = num_groups
+        self.version = 0
+        self.counts = {}
+        self.total_count = 0
+        self.prior_weight = None
+        self.prior_a = 0.0
+        self.prior_b = 0.0
+        self.set_counts(initial_count)
+        self.version = 0
+
+    def __getstate__(self):
+        return (self.num_groups, self.version, self.counts)
+
+    def __setstate__(self, state):
+        num_groups, version, counts = state
+        self.__init__(num_groups, initial_count=counts)
+        self.version = version
+
+    @property
+    def array(self):
+        """
+        A dense NumPy copy of the counts.
+        """
+        counts = np.zeros(self.num_groups, dtype=np.int64)
+        if self.counts:
+            counts[list(self.counts)] = list(self.counts.values())
+        return counts
+
+    def __getitem__(self, group):
+        return self.counts.get(group, 0)
+
+    def __str__(self):
+        return str(self.counts)
+
+    def add_point(self, group):
+        counts = self.counts
+        counts[group] = counts.get(group, 0) + 1
+        self.total_count += 1
+        self.version += 1
+
+    def add_points(self, groups):
+        counts = self.counts
+        for group in groups:
+            counts[group] = counts.get(group, 0) + 1
+        self.total_count += len(groups)
+        self.version += 1
+
+    def decrement_point(self, group):
+        count = self.counts[group] - 1
+        if count:
+            self.counts[group] = count
+        else:
+            del self.counts[group]
+        self.total_count -= 1
+        self.version += 1
+
+    def reset(self):
+        self.counts.clear()
+        self.total_count = 0
+        self.version += 1
+
+    def set_counts(self, counts):
+        """
+        Overwrites every count, given in any of the forms of initial_count.
+        """
+        if type(counts) == int:
+            counts = [counts] * self.num_groups if counts else {}
+        if hasattr(counts, "items"):
+            items = counts.items()
+        else:
+            items = enumerate(counts)
+        self.counts = { int(g) : int(c) for g, c in items if c }
+        self.total_count = sum(self.counts.values())
+        self.version += 1
+
+    def snapshot(self):
+        return dict(self.counts)
+
+    def items(self):
+        return sorted(self.counts.items())
+
+    def prob(self, group, dupes=0):
+        if self.total_count == 0:
+            return -1
+        else:
+            net_count = self.counts.get(group, 0) - dupes
+            return net_count / self.total_count
+
+    def bayes_prob(self, group, prior_weight, dupes=0):
+        if self.total_count == 0:
+            return -1
+        else:
+            if prior_weight != self.prior_weight:
+                self.set_prior(prior_weight)
+            net_count = self.counts.get(group, 0) - dupes
+            return (net_count + self.prior_a) / (self.total_count + self.prior_b)
+
+    def zero_prob(self, prior_weight=None):
+        """
+        @returns prob(group), or bayes_prob(group, prior_weight) if a prior
+                 weight is given, of every group with a zero count
+        """
+        if self.total_count == 0:
+            return -1
+        elif prior_weight is None:
+            return 0 / self.total_count
+        else:
+            if prior_weight != self.prior_weight:
+                self.set_prior(prior_weight)
+            return (0 + self.prior_a) / (self.total_count + self.prior_b)
+
+    def is_satisfied_by(self, other):
+        for group, count in self.counts.items():
+            if count > other[group]:
+                return False
+        return True
+
+class QueryTracker(StatTracker):
+    """
+    A count tracker which also keeps track of which groups of a query it does
+    not satisfy yet, and of the total remaining query, updated in constant
+    time per point instead of rescanning every group. 
+    """
+    __slots__ = ("query", "unsatisfied", "remaining")
+
+    def __init__(self, query):
+        """
+        @params
+            query: a StatTracker with the desired count
+        """
+        super().__init__(query.num_groups)
+        self.query = query
+        self.recount()
+
+    def __getstate__(self):
+        return (self.query, self.version, self.counts.tolist())
+
+    def __setstate__(self, state):
+        query, version, counts = state
+        self.__init__(query)
+        self.set_counts(counts)
+        self.version = version
+
+    def recount(self):
+        """
+        Recomputes the unsatisfied groups and the remaining query from the
+        counts.
+        """
+        counts = self.counts
+        query = self.query
+        # Used as an ordered set, so groups are listed in increasing order
+        self.unsatisfied = dict.fromkeys(g for g in range(self.num_groups)
+                                         if counts[g] < query[g])
+        self.remaining = sum(max(0, query[g] - counts[g])
+                             for g in range(self.num_groups))
+
+    def reset(self):
+        super().reset()
+        self.recount()
+
+    def set_counts(self, counts):
+        super().set_counts(counts)
+        self.recount()
+
+    def add_point(self, group):
+        self.counts[group] += 1
+        self.total_count += 1
+        self.version += 1
+        if self.counts[group] <= self.query[group]:
+            self.remaining -= 1
+            if self.counts[group] == self.query[group]:
+                del self.unsatisfied[group]
+
+    def add_points(self, groups):
+        for group in groups:
+            self.add_point(group)
+
+    def decrement_point(self, group):
+        self.counts[group] -= 1
+        self.total_count -= 1
+        self.version += 1
+        if self.counts[group] < self.query[group]:
+            self.remaining += 1
+            if group not in self.unsatisfied:
+                self.unsatisfied[group] = None
+                self.unsatisfied = dict.fromkeys(sorted(self.unsatisfied))
+
+    def is_satisfied(self):
+        """
+        @returns whether the query is satisfied by the tracked counts
+        """
+        return not self.unsatisfied
+
+    def unsatisfied_groups(self):
+        """
+        @returns a list of group indices whose query is not satisfied
+        """
+        return list(self.unsatisfied)
+
+class MultiQueryTracker(QueryTracker):
+    """
+    Tracks many queries over the same groups at once. A point counts towards
+    every query which still needs its group, so the combined query asks for
+    the largest count of every group over all queries, and each query is
+    satisfied by the first points of every group collected for the combined
+    query. 
+    """
+    __slots__ = ("queries", "trackers", "waiting", "satisfied_at")
+
+    def __init__(self, queries):
+        """
+        @params
+            queries: a non-empty list of StatTracker instances with the
+                     desired counts over the same groups
+        """
+        num_groups = queries[0].num_groups
+        if any(query.num_groups != num_groups for query in queries):
+            raise ValueError("queries must have the same number of groups")
+        combined = StatTracker(num_groups,
+            initial_count=[ max(query[g] for query in queries)
+                            for g in range(num_groups) ])
+        super().__init__(combined)
+        self.queries = queries
+        self.trackers = [ QueryTracker(query) for query in queries ]
+        self.reroute()
+
+    def __getstate__(self):
+        return (self.queries, self.version, self.counts.tolist())
+
+    def __setstate__(self, state):
+        queries, version, counts = state
+        self.__init__(queries)
+        self.set_counts(counts)
+        self.version = version
+
+    def reroute(self):
+        """
+        Recomputes the count of every query from the combined counts.
+        """
+        for tracker in self.trackers:
+            tracker.set_counts([ min(self.counts[g], tracker.query[g])
+                                 for g in range(self.num_groups) ])
+        # waiting[g] lists the queries which still need group g
+        self.waiting = [ [ q for q, tracker in enumerate(self.trackers)
+                           if tracker[g] < tracker.query[g] ]
+                         for g in range(self.num_groups) ]
+        # Number of points collected when each query got satisfied
+        self.satisfied_at = [ self.total_count if tracker.is_satisfied()
+                              else None for tracker in self.trackers ]
+
+    def add_point(self, group):
+        super().add_point(group)
+        waiting = self.waiting[group]
+        if waiting:
+            for q in waiting:
+                tracker = self.trackers[q]
+                tracker.add_point(group)
+                if not tracker.unsatisfied:
+                    self.satisfied_at[q] = self.total_count
+            self.waiting[group] = [ q for q in waiting
+                                    if group in self.trackers[q].unsatisfied ]
+
+    def add_points(self, groups):
+        for group in groups:
+            self.add_point(group)
+
+    def decrement_point(self, group):
+        super().decrement_point(group)
+        self.reroute()
+
+    def reset(self):
+        super().reset()
+        self.reroute()
+
+    def set_counts(self, counts):
+        super().set_counts(counts)
+        self.reroute()
+
 # Test cases
 if __name__ == '__main__':
     a = StatTracker(5)
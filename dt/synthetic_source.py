@@ -1,4 +1,5 @@
 import random
+import numpy as np
 from .data_point import *
 from .stat_tracker import *
 
@@ -7,20 +8,43 @@ Represents a synthetic data source with seeded group probabilities.
 """
 
 class SyntheticSource:
-    def __init__(self, num_groups, cost, weights):
+    # An optional random.Random instance used by sample() instead of the
+    # global random module, see set_stream()
+    stream = None
+
+    def __init__(self, num_groups, cost, weights, block_size=4096, rng=None):
         """
         @params:
             num_groups: the number of groups that data points may belong to
             cost: cost of sampling from this data source
             weights: an m-length array of weights for each group
+            block_size: number of group labels pre-drawn at once by
+                        sample_group()
+            rng: a numpy Generator used by sample_group(), if not given one
+                 is seeded from the random module so that seeding random
+                 makes runs reproducible
         """
         self.num_groups = num_groups
         self.cost = float(cost)
         self.probs = [ w / sum(weights) for w in weights ]
+        # Cumulative probability table for block sampling of group labels
+        self.cum_probs = np.cumsum(self.probs)
+        self.block_size = block_size
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        self.rng = rng
+        self.block = []
+        self.block_pos = 0
+        # State of rng before the current block was drawn, so that the block
+        # can be redrawn instead of saved, see get_random_state()
+        self.block_state = None
         # The stat tracker which is ticked whenever the sample method is called
         self.sample_stats = StatTracker(num_groups)
         self.unique_sample_stats = StatTracker(num_groups)
         self.synthetic = True
+        self.sparse = False
+        # Sources are infinite, so there is nothing to draw without
+        self.replace = True
 
     def __str__(self):
         s = "{Cost: " + str(self.cost)
@@ -48,20 +72,150 @@ class SyntheticSource:
         else:
             return self.probs[group]
     
+    def probability_function(self, method="gt", prior_weight=20):
+        """
+        Resolves the probability method once, for callers which compute many
+        probabilities with the same method and prior weight. 
+        @returns a function from group to probability(group, method,
+                 prior_weight)
+        """
+        if method == "sample-nodupe":
+            return lambda group: self.sample_stats.prob(group)
+        elif method == "bayes-nodupe":
+            return lambda group: self.sample_stats.bayes_prob(group,
+                prior_weight)
+        else:
+            return self.probs.__getitem__
+
+    def probabilities_function(self, method="gt", prior_weight=20):
+        """
+        Like probability_function(), but for all groups at once.
+        @returns a function with no arguments returning the array of
+                 probability(group, method, prior_weight) for every group
+        """
+        if method == "sample-nodupe":
+            return lambda: self.sample_stats.probs()
+        elif method == "bayes-nodupe":
+            return lambda: self.sample_stats.bayes_probs(prior_weight)
+        else:
+            probs = np.array(self.probs)
+            return lambda: probs
+
+    def version_function(self, method="gt"):
+        """
+        @returns a function whose value changes whenever
+                 probability(group, method) may have changed for some group
+        """
+        if method in ["sample-nodupe", "bayes-nodupe"]:
+            return lambda: (self.sample_stats, self.sample_stats.version)
+        else:
+            return lambda: ()
+
     def sample(self):
         """
         @returns a uniformly random data point and updates sample_stats
         """
-        group = random.choices(
+        rand = self.stream or random
+        group = rand.choices(
             population = range(self.num_groups),
             weights = self.probs,
             k=1
         )[0]
         self.sample_stats.add_point(group)
-        return DataPoint(group, random.randrange(9223372036854775807))
+        return DataPoint(group, rand.randrange(9223372036854775807))
+
+    def sample_batch(self, k):
+        """
+        @returns a list of k random data points and updates sample_stats
+        """
+        rand = self.stream or random
+        groups = rand.choices(range(self.num_groups), weights=self.probs, k=k)
+        self.sample_stats.add_points(groups)
+        return [ DataPoint(group, rand.randrange(9223372036854775807))
+                 for group in groups ]
+
+    def refill_block(self):
+        """
+        Pre-draws the next block_size group labels by inverting the cumulative
+        probability table. 
+        """
+        self.block_state = self.rng.bit_generator.state
+        draws = self.rng.random(self.block_size) * self.cum_probs[-1]
+        block = np.searchsorted(self.cum_probs, draws, side='right')
+        # Guard against floating point round-off at the upper end
+        np.minimum(block, self.num_groups - 1, out=block)
+        self.block = block.tolist()
+        self.block_pos = 0
+
+    def sample_group(self):
+        """
+        Samples without materializing a DataPoint, since synthetic data points
+        carry no data beyond their group. 
+        @returns the group of a random data point and updates sample_stats
+        """
+        if self.block_pos == len(self.block):
+            self.refill_block()
+        group = self.block[self.block_pos]
+        self.block_pos += 1
+        self.sample_stats.add_point(group)
+        return group
     
+    def sample_group_batch(self, k):
+        """
+        Batched version of sample_group(). 
+        @returns a list of the groups of k random data points and updates
+                 sample_stats
+        """
+        groups = []
+        while len(groups) < k:
+            if self.block_pos == len(self.block):
+                self.refill_block()
+            end = min(len(self.block), self.block_pos + k - len(groups))
+            groups.extend(self.block[self.block_pos:end])
+            self.block_pos = end
+        self.sample_stats.add_points(groups)
+        return groups
+
+    def set_stream(self, seed):
+        """
+        Gives this source its own random streams, for both sample() and
+        sample_group(), so that its k-th draw is the same no matter how draws
+        from other sources are interleaved.
+        """
+        self.stream = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        self.block = []
+        self.block_pos = 0
+        self.block_state = None
+
+    def get_random_state(self):
+        """
+        @returns the state of this source's random streams and of its block
+                 of pre-drawn group labels
+        """
+        stream = None
+        if self.stream is not None:
+            stream = self.stream.getstate()
+        return { "stream": stream, "rng": self.rng.bit_generator.state,
+                 "block_state": self.block_state,
+                 "block_pos": self.block_pos }
+
+    def set_random_state(self, state):
+        if state["stream"] is not None:
+            self.stream = random.Random()
+            self.stream.setstate(state["stream"])
+        if state["block_state"] is not None:
+            # Redrawing the block leaves rng in its saved state
+            self.rng.bit_generator.state = state["block_state"]
+            self.refill_block()
+            self.block_pos = state["block_pos"]
+        else:
+            self.rng.bit_generator.state = state["rng"]
+            self.block = []
+            self.block_pos = 0
+
     def reset_sample(self):
-        self.sample_stats = StatTracker(self.num_groups)
+        self.sample_stats.reset()
 
 # Test cases
 if __name__ == '__main__':
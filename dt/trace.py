@@ -0,0 +1,89 @@
+import numpy as np
+
+"""
+Records where the time and cost of a single DT.run go. All counters live in
+preallocated arrays, and the fill curve of the collected counts is only
+sampled every few iterations and whenever a group becomes satisfied.
+"""
+
+class RunTrace:
+    def __init__(self, num_sources, num_groups, every=1000, capacity=1024):
+        """
+        @params
+            num_sources: number of data sources in the DT instance
+            num_groups: number of groups in the DT instance
+            every: the fill curve is recorded every this many iterations
+            capacity: initial number of fill curve rows, doubled when full
+        """
+        self.every = every
+        self.next_record = every
+        # Seconds spent choosing sources, drawing samples, and deduplicating
+        # and updating the collected counts
+        self.select_time = 0.0
+        self.sample_time = 0.0
+        self.dedup_time = 0.0
+        self.source_picks = np.zeros(num_sources, dtype=np.int64)
+        self.source_draws = np.zeros(num_sources, dtype=np.int64)
+        self.draws = 0
+        self.duplicates = 0
+        # Iteration at which each group was satisfied, -1 if never
+        self.satisfied_at = np.full(num_groups, -1, dtype=np.int64)
+        self.fill_iterations = np.zeros(capacity, dtype=np.int64)
+        self.fill_counts = np.zeros((capacity, num_groups), dtype=np.int64)
+        self.fill_size = 0
+
+    def record_fill(self, iteration, collected_stats):
+        """
+        Appends a row of the collected count of every group to the fill curve.
+        """
+        if self.fill_size == len(self.fill_iterations):
+            self.fill_iterations = np.concatenate(
+                [self.fill_iterations, np.zeros_like(self.fill_iterations)])
+            self.fill_counts = np.concatenate(
+                [self.fill_counts, np.zeros_like(self.fill_counts)])
+        self.fill_iterations[self.fill_size] = iteration
+        self.fill_counts[self.fill_size] = collected_stats.array
+        self.fill_size += 1
+
+    def record_draws(self, source_index, k, new_groups, iteration, dt):
+        """
+        Updates the counters after k draws from a source yielded new_groups
+        as new unique points, ending at the specified iteration.
+        """
+        self.source_picks[source_index] += 1
+        self.source_draws[source_index] += k
+        self.draws += k
+        self.duplicates += k - len(new_groups)
+        satisfied = False
+        for group in new_groups:
+            if (self.satisfied_at[group] < 0
+                and dt.collected_stats[group] >= dt.query[group]):
+                self.satisfied_at[group] = iteration
+                satisfied = True
+        if satisfied or iteration >= self.next_record:
+            self.record_fill(iteration, dt.collected_stats)
+            while self.next_record <= iteration:
+                self.next_record += self.every
+
+    def duplicate_rate(self):
+        if self.draws == 0:
+            return 0.0
+        return self.duplicates / self.draws
+
+    def as_dict(self):
+        """
+        @returns the trace as a dictionary of plain values and arrays
+        """
+        return {
+            "select_time": self.select_time,
+            "sample_time": self.sample_time,
+            "dedup_time": self.dedup_time,
+            "source_picks": self.source_picks,
+            "source_draws": self.source_draws,
+            "draws": self.draws,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicate_rate(),
+            "satisfied_at": self.satisfied_at,
+            "fill_iterations": self.fill_iterations[:self.fill_size],
+            "fill_counts": self.fill_counts[:self.fill_size],
+        }
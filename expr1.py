@@ -13,6 +13,7 @@ query_prob_increment = 1
 probs = [0.1, 0.3, 0.5, 0.7, 0.9]
 policies = ['random', 'coupcoll-nodupe', 'ratiocoll-nodupe', 'epsilon-exact-nodupe']
 rep = 30
+results_path = 'results/experiments.db'
 
 def create_synthetic_sources(p1, p2):
     ds1 = SyntheticSource(2, 1.0, [p1, 1 - p1])
@@ -35,21 +36,12 @@ if __name__ == '__main__':
     """
     Output to stdout can easily be piped to csv. 
     """
-    print("p1,p2,g1_ratio,policy,avg_cost")
-    for p1 in probs:
-        for p2 in probs:
-            if p1 + p2 < 1.0:
-                # Skip impossible combinations
-                continue
-            else:
-                g1_prob = 0
-                while g1_prob <= 100:
-                    for policy in policies:
-                        cost_sum = 0.0
-                        for r in range(rep):
-                            dt = create_dt(p1, p2, g1_prob * 0.01)
-                            tc = dt.run(policy)
-                            cost_sum += tc
-                        avg_cost = cost_sum / rep
-                        print(str(round(p1, 2)) + ',' + str(round(p2, 2)) + ',' + str(g1_prob) + ',' + policy + ',' + str(avg_cost))
-                    g1_prob += query_prob_increment
+    # Skip impossible combinations
+    configs = [ (p1, p2, g1_prob * 0.01) for p1 in probs for p2 in probs
+                if p1 + p2 >= 1.0
+                for g1_prob in range(0, 101, query_prob_increment) ]
+    run_grid(create_dt, configs, policies, rep, ["p1", "p2", "g1_ratio"],
+             stat_columns=["avg_cost"],
+             format_config=lambda config: [str(round(config[0], 2)),
+                 str(round(config[1], 2)), str(int(round(config[2] * 100)))],
+             store=ResultsStore(results_path), experiment="expr1")
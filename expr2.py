@@ -8,8 +8,20 @@ Q = 100, 1000, 10000, 100000, 1000000
 
 probs = [0.1, 0.3, 0.5, 0.7, 0.9]
 query_counts = [32, 64, 128, 256, 512, 1024, 2048, 5096]
-policies = ['random', 'coupcoll', 'ratiocoll', 'union-bound', 'asymptotic', 'epsilon-exact']
+policies = ['random', 'coupcoll-nodupe', 'ratiocoll-nodupe', 'epsilon-exact-nodupe']
+estimators = {
+    'union-bound': union_bound,
+    'asymptotic': asymptotic_estimate,
+    'exact-coupcoll': lambda dt: exact_estimate(dt, 'coupcoll-nodupe')[0],
+    'exact-ratiocoll': lambda dt: exact_estimate(dt, 'ratiocoll-nodupe')[0],
+}
+policy_names = {
+    'coupcoll-nodupe': 'coupcoll',
+    'ratiocoll-nodupe': 'ratiocoll',
+    'epsilon-exact-nodupe': 'epsilon-exact',
+}
 rep = 30
+results_path = 'results/experiments.db'
 
 def create_synthetic_sources(p1, p2):
     ds1 = SyntheticSource(2, 1.0, [p1, 1 - p1])
@@ -25,29 +37,21 @@ def create_dt(p1, p2, total_query):
     dt = DT(2, create_synthetic_sources(p1, p2), query)
     return dt
 
+def format_config(config):
+    p1, p2, total_query = config
+    return [str(int(p1 * 100)), str(int(p2 * 100)), str(total_query)]
+
 if __name__ == '__main__':
     print("p1,p2,total_query,policy,avg_cost")
-    for p1 in probs:
-        for p2 in probs:
-            if p1 + p2 < 1.0:
-                continue # Impossible
-            else:
-                for total_query in query_counts:
-                    for policy in policies:
-                        if policy == 'union-bound':
-                            dt = create_dt(p1, p2, total_query)
-                            cost = union_bound(dt)
-                            print(str(int(p1 * 100)) + ',' + str(str(int(p2 * 100))) + ',' + str(total_query) + ',' + policy + ',' + str(cost))
-                        elif policy == 'asymptotic':
-                            dt = create_dt(p1, p2, total_query)
-                            cost = asymptotic_estimate(dt)
-                            print(str(int(p1 * 100)) + ',' + str(str(int(p2 * 100))) + ',' + str(total_query) + ',' + policy + ',' + str(cost))
-                        else:
-                            cost_sum = 0.0
-                            for r in range(rep):
-                                dt = create_dt(p1, p2, total_query)
-                                us, cs, tc = dt.run(policy)
-                                cost_sum += tc
-                                #print(tc)
-                            avg_cost = cost_sum / rep
-                            print(str(int(p1 * 100)) + ',' + str(str(int(p2 * 100))) + ',' + str(total_query) + ',' + policy + ',' + str(avg_cost))
+    # Impossible combinations are skipped
+    configs = [ (p1, p2, total_query) for p1 in probs for p2 in probs
+                if p1 + p2 >= 1.0 for total_query in query_counts ]
+    # Analytic estimates need no sampling
+    for config in configs:
+        for name, estimator in estimators.items():
+            cost = estimator(create_dt(*config))
+            print(','.join(format_config(config) + [name, str(cost)]))
+    run_grid(create_dt, configs, policies, rep, ["p1", "p2", "total_query"],
+             stat_columns=["avg_cost"], format_config=format_config,
+             policy_names=policy_names, write_header=False,
+             store=ResultsStore(results_path), experiment="expr2")
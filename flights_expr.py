@@ -1,5 +1,4 @@
 from dt import *
-import pickle
 
 """
 FLIGHTS EXPERIMENT: The flights dataset, equi-cost, uniform requirements. 
@@ -11,11 +10,11 @@ query_counts = [10, 100, 1000, 10000]
 policies = ['random', 'coupcoll-nodupe', 'ratiocoll-nodupe', 'epsilon-exact-nodupe', 'coupcoll-dupe', 'ratiocoll-dupe', 'epsilon-exact-dupe', 'ucb']
 #policies = ['ucb-exact-dupe']
 reps = 5
+results_path = 'results/experiments.db'
 num_groups = 51
 
 def load_sources():
-    with open("data/flights_sources.pickle", "rb") as f:
-        return pickle.load(f)
+    return open_sources("data/flights_sources")
 
 def create_dt(query_count):
     query_counts = [query_count] * num_groups
@@ -23,16 +22,6 @@ def create_dt(query_count):
     return DT(num_groups, load_sources(), query)
 
 if __name__ == '__main__':
-    print("query_per_group,policy,avg_cost,avg_iters")
-    for query_count in query_counts:
-        for policy in policies:
-            cost_sum = 0.0
-            iter_sum = 0
-            for rep in range(reps):
-                dt = create_dt(query_count)
-                tc, iters = dt.run(policy)
-                cost_sum += tc
-                iter_sum += iters
-            avg_cost = cost_sum / reps
-            avg_iters = iter_sum / reps
-            print(str(query_count) + ',' + policy + ',' + str(avg_cost) + ',' + str(avg_iters))
\ No newline at end of file
+    run_grid(create_dt, [ (query_count,) for query_count in query_counts ],
+             policies, reps, ["query_per_group"], run_kwargs={"disjoint": True},
+             store=ResultsStore(results_path), experiment="flights")
@@ -1,11 +1,8 @@
 import pandas as pd
 from dt import *
-import pickle
 
-df = pd.read_csv('data/flights.csv')
-split_df = df.groupby(['MKT_UNIQUE_CARRIER'])
-carriers = set(df['MKT_UNIQUE_CARRIER'])
-states = set(df['ORIGIN_STATE_NM'])
+csv_path = 'data/flights.csv'
+chunksize = 1000000 # Rows read from the CSV at a time
 states_dict = {
  'Alabama': 0,
  'AL': 0,
@@ -113,22 +110,30 @@ states_dict = {
  'VI': 50,
 }
 
-def create_sources():
-    sources = []
-    for carrier in carriers:
-        source = RealSource(51, 1.0)
-        carrier_df = split_df.get_group(carrier)
-        for index, row in carrier_df.iterrows():
-            group = states_dict[row['ORIGIN_STATE_NM']]
-            data = index
-            point = DataPoint(group, data)
-            source.add_point(point)
-            print(str(index), end="\r")
-        sources.append(source)
-        print(str(carrier), end="\r")
-    return sources
+# Groups are origin states; more attributes, such as the carrier or a delay
+# bucket, can be added to define intersectional groups
+schema = GroupSchema([('ORIGIN_STATE_NM', states_dict)])
 
-sources = create_sources()
+def create_sources(path=csv_path, schema=schema):
+    """
+    Streams the CSV in chunks and appends each carrier's rows to its own
+    ArraySource, so memory is bounded by the chunk size plus the compact
+    sources. The record id of a flight is its row number in the CSV. 
+    """
+    sources = {}
+    reader = pd.read_csv(path, usecols=['MKT_UNIQUE_CARRIER'] + schema.names,
+                         dtype='category', chunksize=chunksize)
+    for chunk in reader:
+        groups = schema.encode(chunk)
+        ids = chunk.index.to_numpy()
+        carriers = chunk['MKT_UNIQUE_CARRIER'].cat
+        add_to_sources(sources, carriers.codes.to_numpy(), groups, ids,
+                       lambda carrier: ArraySource(schema.num_groups, 1.0),
+                       labels=carriers.categories)
+        print(str(ids[-1]), end="\r")
+    return [ sources[carrier] for carrier in sorted(sources) ]
 
-with open("data/flights_sources.pickle", "wb") as f:
-    pickle.dump(sources, f)
\ No newline at end of file
+if __name__ == '__main__':
+    sources = create_sources()
+    save_sources(sources, "data/flights_sources")
+    save_schema(schema, "data/flights_sources")
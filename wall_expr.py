@@ -16,6 +16,7 @@ policy_displayname = {
     'ucb': 'UCB',
 }
 rep = 50
+results_path = 'results/experiments.db'
 n_m_combos = [
     [2, 10],
     [4, 10],
@@ -44,7 +45,7 @@ def assign_costs(n, cost_model):
     elif cost_model == "random":
         return [ 2 * (1 - random.random()) for i in range(n) ]
     elif cost_model == "skewed":
-        return [np.random.default_rng().pareto(2, None) for i in range(n)]
+        return [np.random.pareto(2) for i in range(n)]
     else: 
         return [1.0] * n
 
@@ -111,20 +112,10 @@ def create_dt(n, m, majority, cost_model):
     return DT(m, all_ds, query)
 
 if __name__ == '__main__':
-    print("n,m,majority_distribution,cost_model,policy,avg_cost,avg_iters")
-    for n_m in n_m_combos:
-        n = n_m[0]
-        m = n_m[1]
-        for majority in [True, False]:
-            for cost_model in ['uniform', 'random', 'skewed']:
-                for policy in policies:
-                    cost_sum = 0.0
-                    iters_sum = 0
-                    for r in range(rep):
-                        dt = create_dt(n, m, majority, cost_model)
-                        cost, iters = dt.run(policy)
-                        cost_sum += cost
-                        iters_sum += iters
-                    avg_cost = cost_sum / rep
-                    avg_iters = iters_sum / rep
-                    print(str(n) + ',' + str(m) + ',' + str(majority) + ',' + cost_model + ',' + policy_displayname[policy] + ',' + str(avg_cost) + ',' + str(avg_iters))
+    configs = [ (n, m, majority, cost_model) for n, m in n_m_combos
+                for majority in [True, False]
+                for cost_model in ['uniform', 'random', 'skewed'] ]
+    run_grid(create_dt, configs, policies, rep,
+             ["n", "m", "majority_distribution", "cost_model"],
+             policy_names=policy_displayname, run_kwargs={"simulate": True},
+             store=ResultsStore(results_path), experiment="wall")